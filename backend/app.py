@@ -1,5 +1,9 @@
-import eventlet
-eventlet.monkey_patch()
+if __name__ == '__main__':
+    # Patch before Flask and the modules eventlet replaces are imported. Stage
+    # processes are spawned and import this module as __mp_main__; they skip
+    # the patching and the server setup below.
+    import eventlet
+    eventlet.monkey_patch()
 
 # Import configured modules
 from flask import Flask
@@ -9,35 +13,44 @@ from flask_socketio import SocketIO
 from config import logger, load_config, initialize_app_config
 from routes import register_routes
 from socketio_events import register_socketio_events
+from pipeline import use_native_logging_locks
 
-# Load application configuration first
-app_config = load_config()
-
-# Extract async mode from config
-async_mode = app_config['socket']['async_mode']
+def create_app(app_config):
+    """Create the Flask app and its Socket.IO server from the loaded config"""
+    # Extract async mode from config
+    async_mode = app_config['socket']['async_mode']
 
-# Log startup information
-logger.info(f"Using {async_mode} mode for Socket.IO")
+    # Log startup information
+    logger.info(f"Using {async_mode} mode for Socket.IO")
 
-# Create Flask app
-app = Flask(__name__, static_folder='frontend/build', static_url_path='')
+    # Create Flask app
+    app = Flask(__name__, static_folder='frontend/build', static_url_path='')
 
-# Initialize app configuration
-initialize_app_config(app, app_config)
+    # Initialize app configuration
+    initialize_app_config(app, app_config)
 
-# Initialize SocketIO with config
-socketio = SocketIO(app, 
-                   cors_allowed_origins=app_config['socket']['cors_allowed_origins'], 
-                   async_mode=async_mode,
-                   ping_timeout=app_config['socket']['ping_timeout'],
-                   ping_interval=app_config['socket']['ping_interval'])
+    # Initialize SocketIO with config
+    socketio = SocketIO(app, 
+                       cors_allowed_origins=app_config['socket']['cors_allowed_origins'], 
+                       async_mode=async_mode,
+                       ping_timeout=app_config['socket']['ping_timeout'],
+                       ping_interval=app_config['socket']['ping_interval'])
 
-# Register routes and socket event handlers
-register_routes(app, socketio, app_config)
-register_socketio_events(socketio)
+    # Register routes and socket event handlers
+    register_routes(app, socketio, app_config)
+    register_socketio_events(socketio)
+    return app, socketio
 
 if __name__ == '__main__':
+    # Load application configuration first
+    app_config = load_config()
+    app, socketio = create_app(app_config)
+
+    # Stage threads of the threading engine log too; give them locks that
+    # monkey patching has not made green
+    use_native_logging_locks()
+
     host = app_config['server']['host']
     port = app_config['server']['port']
     logger.info(f"Server starting on http://{host}:{port}")
-    socketio.run(app, host=host, port=port) 
\ No newline at end of file
+    socketio.run(app, host=host, port=port)
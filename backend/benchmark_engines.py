@@ -0,0 +1,130 @@
+"""
+Benchmark the pipeline engines side by side.
+
+Every input video is run through the Streamer -> Detector -> Display pipeline
+once per engine, and the output frames are JPEG encoded the same way the server
+does before streaming. Streamer pacing is disabled so the numbers reflect the
+pipeline itself. With no video arguments, synthetic clips are generated.
+
+Usage:
+    python benchmark_engines.py [video ...] [--engines multiprocessing threading] [--repeat 3]
+"""
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import tempfile
+import cv2
+import numpy as np
+from pipeline import Pipeline, ENGINES, STAGES
+
+# Synthetic clips as (name, width, height, frame count)
+SYNTHETIC_CLIPS = [
+    ('small', 320, 240, 150),
+    ('medium', 640, 480, 300),
+    ('large', 1280, 720, 300)
+]
+
+def make_synthetic_clip(path, width, height, frame_count):
+    """Write a clip with a noisy static background and a moving square"""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), 30, (width, height))
+    rng = np.random.default_rng(0)
+    background = rng.integers(40, 80, (height, width, 3), dtype=np.uint8)
+    size = height // 6
+    for i in range(frame_count):
+        frame = background.copy()
+        x = (i * 7) % (width - size)
+        y = height // 2 - size // 2
+        cv2.rectangle(frame, (x, y), (x + size, y + size), (255, 255, 255), -1)
+        writer.write(frame)
+    writer.release()
+
+def run_pipeline(engine, video_path, app_config):
+    """Run one video through one engine and return its measurements"""
+    streamer_config = dict(app_config.get('streamer', {}), sleep_delay=0)
+    encoding_quality = app_config.get('client', {}).get('ui', {}).get('encoding_quality', 85)
+    encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), encoding_quality]
+
+    start_time = time.perf_counter()
+    pipeline = Pipeline(engine, app_config.get('processing', {}).get('queue_sizes', {}))
+    pipeline.start(
+        video_path,
+        streamer_config,
+        app_config.get('detector', {}),
+        app_config.get('display', {})
+    )
+
+    frame_count = 0
+    first_frame_time = None
+    stage_totals = dict.fromkeys(STAGES + ['encoder'], 0.0)
+    while True:
+        # Checked before the get, so an empty queue afterwards means we are done
+        finished = not pipeline.is_alive()
+        try:
+            processed_frame, timings = pipeline.stream_queue.get(timeout=0.1)
+        except queue.Empty:
+            if finished:
+                break
+            continue
+
+        encode_start = time.perf_counter()
+        cv2.imencode('.jpg', processed_frame, encode_param)
+        timings['encoder'] = time.perf_counter() - encode_start
+
+        if first_frame_time is None:
+            first_frame_time = time.perf_counter() - start_time
+        for stage in stage_totals:
+            stage_totals[stage] += timings.get(stage, 0.0)
+        frame_count += 1
+
+    elapsed = time.perf_counter() - start_time
+    return {
+        'frames': frame_count,
+        'seconds': elapsed,
+        'fps': frame_count / elapsed if elapsed else 0.0,
+        'first_frame': first_frame_time or 0.0,
+        'stage_ms': {stage: 1000 * total / max(frame_count, 1) for stage, total in stage_totals.items()}
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline engines side by side')
+    parser.add_argument('videos', nargs='*', help='Videos to process (default: synthetic clips)')
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, default=ENGINES)
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per engine and video; the best is reported')
+    parser.add_argument('--config', default='config.json')
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        app_config = json.load(f)
+
+    videos = [(os.path.basename(path), path) for path in args.videos]
+    tmp_dir = None
+    if not videos:
+        tmp_dir = tempfile.TemporaryDirectory()
+        for name, width, height, frame_count in SYNTHETIC_CLIPS:
+            path = os.path.join(tmp_dir.name, f"{name}.mp4")
+            make_synthetic_clip(path, width, height, frame_count)
+            videos.append((f"{name} {width}x{height}", path))
+
+    stage_columns = ' '.join(f"{stage + ' ms':>12}" for stage in STAGES + ['encoder'])
+    print(f"{'video':<20} {'engine':<16} {'frames':>6} {'seconds':>8} {'fps':>8} {'first s':>8} {stage_columns}")
+
+    try:
+        for name, path in videos:
+            for engine in args.engines:
+                # Keep the fastest run to reduce noise from the rest of the system
+                result = min((run_pipeline(engine, path, app_config) for _ in range(args.repeat)),
+                             key=lambda r: r['seconds'])
+                stage_values = ' '.join(f"{ms:>12.2f}" for ms in result['stage_ms'].values())
+                print(f"{name:<20} {engine:<16} {result['frames']:>6} {result['seconds']:>8.2f} "
+                      f"{result['fps']:>8.1f} {result['first_frame']:>8.3f} {stage_values}")
+    finally:
+        if tmp_dir is not None:
+            tmp_dir.cleanup()
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
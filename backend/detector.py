@@ -1,5 +1,13 @@
 import cv2
+import time
+import queue
+import logging
 import numpy as np
+from motion_index import save_motion_index
+from profiler import StageProfiler
+from streamer import END_OF_VIDEO
+
+logger = logging.getLogger(__name__)
 
 """
 The Detector class processes video frames to detect motion. It uses a background
@@ -7,14 +15,31 @@ subtractor to identify moving objects and extracts contours to determine regions
 of interest. The class includes functionality to merge overlapping bounding boxes
 to avoid duplicate detections. Detected regions are sent to the Display process
 along with the original frame. Configuration parameters for motion detection are
-loaded from a JSON file.
+loaded from a JSON file. Detection can run on a downscaled copy of each frame
+and on every Nth frame only; both settings can be changed while running by
+pushing updates through the optional control queue. When an index path is
+given, per-frame box counts and covered area are collected into a motion index
+that is saved once the stream ends, if the Streamer read the video to its end
+and no live downscale change reset the background model part way through. Without an output queue the Detector only
+builds the index. Profiling requests from the optional profile queue are
+served between frames.
 """
 
 class Detector:
-    def __init__(self, input_queue, output_queue, config):
+    def __init__(self, input_queue, output_queue, config, control_queue=None, index_path=None,
+                 profile_queue=None):
         self.input_queue = input_queue
         self.output_queue = output_queue
         self.config = config
+        self.control_queue = control_queue
+        self.index_path = index_path
+        self.profiler = StageProfiler('detector', profile_queue)
+        self.frame_count = 0
+        self.reached_end = False
+        
+        # Per-frame motion index entries
+        self.box_counts = []
+        self.covered_areas = []
         
         # Create background subtractor with config parameters
         self.bg_subtractor = cv2.createBackgroundSubtractorMOG2()
@@ -87,33 +112,108 @@ class Detector:
         
         return boxes
         
-    def detect_motion(self):
-        # Parameters for filtering and sensitivity from config
-        min_contour_area = self.config['min_contour_area']
-        frames_to_stabilize = self.config['frames_to_stabilize']
-        kernel_size = self.config['morph_kernel_size']
+    def apply_control_updates(self):
+        """Apply any config updates pushed by the controller since the last frame"""
+        if self.control_queue is None:
+            return
+        while True:
+            try:
+                update = self.control_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.set_config(update)
+
+    def set_config(self, config):
+        """Update detection configuration"""
+        downscale_changed = (
+            'detection_downscale' in config and
+            config['detection_downscale'] != self.config.get('detection_downscale', 1.0)
+        )
+        self.config.update(config)
+        logger.info(f"Detector config updated: {config}")
+
+        # The background model is resolution specific, so relearn it
+        if downscale_changed:
+            self.bg_subtractor = cv2.createBackgroundSubtractorMOG2()
+            self.frame_count = 0
+
+            # Frames seen while relearning would be indexed as having no
+            # motion, and motion-only playback would skip them
+            if self.index_path is not None:
+                logger.info("Background model reset, not saving the motion index for this run")
+                self.index_path = None
+
+    def _emit(self, frame, detections, timings):
+        """Record the frame in the motion index and forward it to Display"""
+        if self.index_path is not None:
+            frame_area = frame.shape[0] * frame.shape[1]
+            self.box_counts.append(len(detections))
+            self.covered_areas.append(sum(w * h for _, _, w, h in detections) / frame_area)
         
-        frame_count = 0
+        if self.output_queue is not None:
+            self.output_queue.put((frame, detections, timings))
         
+    def detect_motion(self):
+        last_detections = []
+
         while True:
             # Get frame from the queue
-            frame = self.input_queue.get()
+            item = self.input_queue.get()
+            
+            # Only an index of the whole video may be saved
+            if item == END_OF_VIDEO:
+                self.reached_end = True
+                continue
             
             # Check if the streamer has finished
-            if frame is None:
+            if item is None:
                 print("Detector: Received termination signal")
+                self.profiler.stop()
+                if self.index_path is not None:
+                    if self.reached_end:
+                        save_motion_index(self.index_path, self.box_counts, self.covered_areas)
+                    else:
+                        logger.info("Stream ended early, not saving the motion index")
                 # Pass the termination signal to the display
-                self.output_queue.put(None)
+                if self.output_queue is not None:
+                    self.output_queue.put(None)
                 break
+
+            frame, timings = item
+            self.apply_control_updates()
+            self.profiler.poll()
+            start_time = time.perf_counter()
+
+            # Parameters for filtering and sensitivity from config, re-read per
+            # frame so that live updates take effect immediately
+            min_contour_area = self.config['min_contour_area']
+            frames_to_stabilize = self.config['frames_to_stabilize']
+            kernel_size = self.config['morph_kernel_size']
+            downscale = self.config.get('detection_downscale', 1.0)
+            stride = max(1, int(self.config.get('detection_stride', 1)))
             
             # Skip initial frames to allow camera stabilization and background model learning
-            frame_count += 1
-            if frame_count < frames_to_stabilize:
-                self.output_queue.put((frame, []))  # No detections for initial frames
+            self.frame_count += 1
+            if self.frame_count < frames_to_stabilize:
+                timings['detector'] = time.perf_counter() - start_time
+                self._emit(frame, [], timings)  # No detections for initial frames
+                continue
+
+            # Only run detection on every Nth frame and reuse the previous boxes in between
+            if (self.frame_count - frames_to_stabilize) % stride != 0:
+                timings['detector'] = time.perf_counter() - start_time
+                self._emit(frame, last_detections, timings)
                 continue
+
+            # Detect on a reduced copy of the frame when downscaling is enabled
+            if downscale < 1.0:
+                small_frame = cv2.resize(frame, None, fx=downscale, fy=downscale,
+                                         interpolation=cv2.INTER_AREA)
+            else:
+                small_frame = frame
                 
             # Apply background subtraction
-            fg_mask = self.bg_subtractor.apply(frame)
+            fg_mask = self.bg_subtractor.apply(small_frame)
             
             # Noise removal with morphological operations
             kernel = np.ones((kernel_size, kernel_size), np.uint8)
@@ -126,12 +226,16 @@ class Detector:
             # Extract regions with significant motion
             detections = []
             for contour in contours:
-                area = cv2.contourArea(contour)
+                # Compare areas at full resolution
+                area = cv2.contourArea(contour) / (downscale * downscale)
                 if area < min_contour_area:  # Ignore small contours
                     continue
                     
-                # Get bounding box coordinates
+                # Get bounding box coordinates, mapped back to the full frame
                 (x, y, w, h) = cv2.boundingRect(contour)
+                if downscale < 1.0:
+                    x, y = int(x / downscale), int(y / downscale)
+                    w, h = int(np.ceil(w / downscale)), int(np.ceil(h / downscale))
                 
                 # Filtering: ignore detections that are too large (likely false positives)
                 if w*h > 0.5 * frame.shape[0] * frame.shape[1]:
@@ -142,6 +246,8 @@ class Detector:
             # Merge overlapping detection boxes
             if detections:
                 detections = self._merge_overlapping_boxes(detections)
+            last_detections = detections
             
             # Send the original frame and detection regions to Display
-            self.output_queue.put((frame, detections)) 
\ No newline at end of file
+            timings['detector'] = time.perf_counter() - start_time
+            self._emit(frame, detections, timings)
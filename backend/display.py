@@ -2,9 +2,12 @@ import cv2
 import numpy as np
 import datetime
 import os
+import time
+import queue
 import shutil
 import logging
 import json
+from profiler import StageProfiler
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +24,8 @@ class Display:
     """
     Handles frame processing, visualization, and optional saving.
     """
-    def __init__(self, detection_queue=None, stream_queue=None, config=None):
+    def __init__(self, detection_queue=None, stream_queue=None, config=None, control_queue=None,
+                 profile_queue=None):
         """
         Initialize the display processor with configuration
         
@@ -30,11 +34,15 @@ class Display:
             stream_queue: Queue to send processed frames for streaming
             config: Dictionary with display configuration parameters
                    If None, will attempt to load from config.json
+            control_queue: Optional queue of config updates applied while running
+            profile_queue: Optional queue of profiling requests served between frames
         """
         # Store the queues
         self.detection_queue = detection_queue
         self.stream_queue = stream_queue
         self.config = config
+        self.control_queue = control_queue
+        self.profiler = StageProfiler('display', profile_queue)
             
         # Validate that required keys exist
         required_keys = ['blur_kernel_size', 'rectangle', 'timestamp']
@@ -63,6 +71,17 @@ class Display:
             logger.error(f"Missing required configuration keys after update: {missing_keys}")
             raise ValueError(f"Missing required configuration keys after update: {missing_keys}")
     
+    def apply_control_updates(self):
+        """Apply config updates pushed through the control queue, if any"""
+        if self.control_queue is None:
+            return
+        while True:
+            try:
+                update = self.control_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.set_config(update)
+    
     def apply_gaussian_blur(self, frame, x, y, w, h, kernel_size):
         """Apply Gaussian blur to a region of the frame"""
         # Extract the region
@@ -131,17 +150,25 @@ class Display:
                 if frame_data is None:
                     break
                     
-                frame, detections = frame_data
+                frame, detections, timings = frame_data
+                
+                # Pick up any live config changes and profiling requests before rendering
+                self.apply_control_updates()
+                self.profiler.poll()
                 
                 # Process the frame
+                start_time = time.perf_counter()
                 processed_frame = self.process_frame(frame, detections)
+                timings['display'] = time.perf_counter() - start_time
                 
                 # Send to stream queue if it exists
                 if self.stream_queue is not None:
-                    self.stream_queue.put(processed_frame)
+                    self.stream_queue.put((processed_frame, timings))
                     
             except Exception as e:
                 logger.error(f"Error in display processing: {str(e)}")
                 break
-                
+        
+        # Write out any profile still in progress
+        self.profiler.stop()
         logger.info("Display processing stopped") 
\ No newline at end of file
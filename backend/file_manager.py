@@ -1,12 +1,31 @@
 import os
+import time
 import uuid
 import logging
+from motion_index import index_path_for
 
 logger = logging.getLogger(__name__)
 
+# Seconds after its last write that a temporary frame cache file is taken to
+# be left behind by a writer that died
+STALE_TMP_SECONDS = 3600
+
 def cleanup_video_file(file_path):
-    """Delete a temporary video file if it exists"""
-    if file_path and os.path.exists(file_path):
+    """Delete a temporary video file and its motion index if they exist"""
+    if not file_path:
+        return False
+    
+    # The index can be written after the video is gone, when a stopped
+    # pipeline winds down, so remove it independently
+    index_path = index_path_for(file_path)
+    if os.path.exists(index_path):
+        try:
+            os.remove(index_path)
+            logger.info(f"Deleted motion index: {index_path}")
+        except Exception as e:
+            logger.error(f"Error deleting motion index {index_path}: {str(e)}")
+    
+    if os.path.exists(file_path):
         try:
             os.remove(file_path)
             logger.info(f"Deleted temporary video file: {file_path}")
@@ -16,6 +35,70 @@ def cleanup_video_file(file_path):
             return False
     return False
 
+def enforce_frame_cache_budget(cache_dir, max_bytes, reserve_bytes=0, stale_after=STALE_TMP_SECONDS):
+    """
+    Evict least recently used frame cache entries until the cache fits its budget
+    
+    Args:
+        cache_dir: Frame cache directory
+        max_bytes: Disk budget for the whole cache
+        reserve_bytes: Space to keep free for an entry about to be written
+        stale_after: Seconds without writes after which a temporary file is
+                     removed as an orphan
+    
+    Returns:
+        Number of bytes freed
+    """
+    if not os.path.isdir(cache_dir):
+        return 0
+    
+    # Group files by entry key; the index file's mtime records the last use.
+    # Temporary files of entries being written count towards the budget but
+    # are never evicted from under their writer. Those not written to for
+    # stale_after seconds belong to writers that died and are removed.
+    entries = {}
+    in_progress = 0
+    freed = 0
+    stale_before = time.time() - stale_after
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        if name.endswith('.tmp'):
+            if stat.st_mtime < stale_before:
+                try:
+                    os.remove(path)
+                    freed += stat.st_size
+                    logger.info(f"Removed orphaned frame cache file {name} ({stat.st_size} bytes)")
+                    continue
+                except FileNotFoundError:
+                    continue
+                except Exception as e:
+                    logger.error(f"Error removing orphaned frame cache file {name}: {str(e)}")
+            in_progress += stat.st_size
+            continue
+        key = name.split('.', 1)[0]
+        entry = entries.setdefault(key, {'paths': [], 'size': 0, 'last_used': 0})
+        entry['paths'].append(path)
+        entry['size'] += stat.st_size
+        entry['last_used'] = max(entry['last_used'], stat.st_mtime)
+    
+    total = in_progress + sum(entry['size'] for entry in entries.values())
+    for key, entry in sorted(entries.items(), key=lambda item: item[1]['last_used']):
+        if total + reserve_bytes <= max_bytes:
+            break
+        try:
+            for path in entry['paths']:
+                os.remove(path)
+            total -= entry['size']
+            freed += entry['size']
+            logger.info(f"Evicted frame cache entry {key} ({entry['size']} bytes)")
+        except Exception as e:
+            logger.error(f"Error evicting frame cache entry {key}: {str(e)}")
+    return freed
+
 def generate_unique_filename(original_filename):
     """Generate a unique filename for uploaded video"""
     file_ext = os.path.splitext(original_filename)[1].lower()
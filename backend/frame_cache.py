@@ -0,0 +1,157 @@
+import os
+import uuid
+import hashlib
+import logging
+import numpy as np
+from file_manager import enforce_frame_cache_budget
+
+logger = logging.getLogger(__name__)
+
+# The FrameCache stores the decoded frames of a video so that later runs can
+# skip decoding. Each entry is a raw file of concatenated frames plus a small
+# index holding the byte offset of every frame and the frame shape. Entries are
+# keyed by a digest of the video's contents, so a re-upload of the same file is
+# a cache hit too. Cached frames are read through a memory map without copying.
+# The total size of the cache is kept within a budget by evicting the least
+# recently used entries (see file_manager.enforce_frame_cache_budget). Several
+# processes may decode the same video at once, e.g. a stream and a sweep of one
+# upload, so each writer has its own temporary file and the first to finish
+# publishes the entry.
+
+FRAMES_SUFFIX = '.frames'
+INDEX_SUFFIX = '.index.npz'
+
+
+class FrameCache:
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key_for(self, video_path):
+        """Return the cache key for a video, a digest of its contents"""
+        digest = hashlib.sha1()
+        with open(video_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def paths(self, key):
+        """Return the frames file and index file paths for a key"""
+        base = os.path.join(self.directory, key)
+        return base + FRAMES_SUFFIX, base + INDEX_SUFFIX
+
+    def open(self, key):
+        """
+        Open a cached video
+
+        Returns:
+            A CachedFrames object, or None if the video is not cached
+        """
+        frames_path, index_path = self.paths(key)
+        if not (os.path.exists(frames_path) and os.path.exists(index_path)):
+            return None
+
+        try:
+            with np.load(index_path) as index:
+                offsets = index['offsets']
+                frame_shape = tuple(index['frame_shape'])
+            # Copy-on-write mapping: stages may draw on the frames in place
+            # without touching the file
+            data = np.memmap(frames_path, dtype=np.uint8, mode='c')
+        except Exception as e:
+            logger.error(f"Error opening frame cache entry {key}: {str(e)}")
+            return None
+
+        # Mark the entry as recently used for LRU eviction
+        os.utime(index_path)
+        logger.info(f"Frame cache hit for {key} ({len(offsets)} frames)")
+        return CachedFrames(data, offsets, frame_shape)
+
+    def writer(self, key, frame_shape, expected_frames):
+        """
+        Start writing a new cache entry
+
+        Returns:
+            A FrameCacheWriter, or None if the video would not fit in the budget
+        """
+        expected_bytes = int(np.prod(frame_shape)) * max(expected_frames, 0)
+        if expected_bytes > self.max_bytes:
+            logger.info(f"Video too large for the frame cache ({expected_bytes} bytes), not caching")
+            return None
+
+        enforce_frame_cache_budget(self.directory, self.max_bytes, reserve_bytes=expected_bytes)
+        frames_path, index_path = self.paths(key)
+        return FrameCacheWriter(frames_path, index_path, frame_shape)
+
+    def commit(self, writer):
+        """Publish a finished entry, then trim the cache back to its budget"""
+        if writer.commit():
+            # The expected frame count is only an estimate, so check again
+            enforce_frame_cache_budget(self.directory, self.max_bytes)
+
+
+class CachedFrames:
+    """Zero-copy access to the frames of a cache entry"""
+    def __init__(self, data, offsets, frame_shape):
+        self.data = data
+        self.offsets = offsets
+        self.frame_shape = frame_shape
+        self.frame_bytes = int(np.prod(frame_shape))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        offset = int(self.offsets[i])
+        return self.data[offset:offset + self.frame_bytes].reshape(self.frame_shape)
+
+
+class FrameCacheWriter:
+    """Appends decoded frames to a temporary file and publishes it on commit"""
+    def __init__(self, frames_path, index_path, frame_shape):
+        self.frames_path = frames_path
+        self.index_path = index_path
+        self.frame_shape = frame_shape
+        self.tmp_path = f"{frames_path}.{uuid.uuid4().hex}.tmp"
+        self.file = open(self.tmp_path, 'wb')
+        self.offsets = []
+
+    def write(self, frame):
+        """Append one frame; raises ValueError if its shape differs from the first"""
+        if frame.shape != self.frame_shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match {self.frame_shape}")
+        self.offsets.append(self.file.tell())
+        self.file.write(np.ascontiguousarray(frame).data)
+
+    def commit(self):
+        """
+        Write the offset index and make the entry visible to readers
+
+        Returns:
+            False if another writer published the entry first
+        """
+        if os.path.exists(self.index_path):
+            logger.info(f"{self.frames_path} was cached by another writer, discarding this copy")
+            self.abort()
+            return False
+
+        self.file.close()
+        os.replace(self.tmp_path, self.frames_path)
+
+        # The index goes last and is swapped in whole, so readers never see
+        # an index without its frames or a partly written one
+        index_tmp_path = f"{self.index_path}.{uuid.uuid4().hex}.tmp"
+        with open(index_tmp_path, 'wb') as f:
+            np.savez(f, offsets=np.array(self.offsets, dtype=np.int64),
+                     frame_shape=np.array(self.frame_shape, dtype=np.int64))
+        os.replace(index_tmp_path, self.index_path)
+        logger.info(f"Cached {len(self.offsets)} decoded frames in {self.frames_path}")
+        return True
+
+    def abort(self):
+        """Discard a partially written entry"""
+        if not self.file.closed:
+            self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
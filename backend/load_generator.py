@@ -0,0 +1,234 @@
+"""
+Load test the upload and streaming server with concurrent simulated clients.
+
+For each client count, N clients connect over Socket.IO at the same time and
+each uploads a synthetic video to /api/upload_video. Every client consumes the
+'frame' events it receives; the clients whose upload was accepted also pause,
+resume and finally stop their stream. The report shows, per client count, how
+many uploads were accepted, upload time, delivered FPS per client, frame
+latency percentiles (from the Streamer's capture of the frame to its arrival,
+so pipeline and queue wait are included) and the peak resident memory of the
+server and its stage processes.
+
+The server runs one streaming session at a time: while a video is being
+processed, further uploads are rejected with 409 and every connected client
+receives the broadcast frames of the running session. Rounds with N > 1
+clients therefore measure broadcast fan-out to N clients, not N independent
+sessions.
+
+The server and the clients must run on the same host for the latency numbers
+to be meaningful. Server memory is read from /proc, so it is Linux only.
+
+Usage:
+    python load_generator.py --clients 1 2 4 8 [--url http://localhost:5000] [--launch-server]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+import numpy as np
+import requests
+import socketio
+from benchmark_engines import make_synthetic_clip
+
+# Gaps between frames longer than this are idle time (e.g. paused), not delivery
+IDLE_GAP_SECONDS = 1.0
+
+
+class SimulatedClient:
+    def __init__(self, url, video_path, duration, pause_after, pause_seconds):
+        self.url = url
+        self.video_path = video_path
+        self.duration = duration
+        self.pause_after = pause_after
+        self.pause_seconds = pause_seconds
+
+        self.frame_times = []
+        self.latencies = []
+        self.upload_seconds = None
+        self.upload_status = None
+        self.error = None
+        self.stopped = threading.Event()
+
+        self.sio = socketio.Client(reconnection=False)
+        self.sio.on('frame', self._on_frame)
+        self.sio.on('stream_stopped', lambda data: self.stopped.set())
+
+    def _on_frame(self, data):
+        now = time.time()
+        self.frame_times.append(now)
+        if 'timestamp' in data:
+            self.latencies.append(now - data['timestamp'])
+
+    def upload(self):
+        """Upload the video and record how long it took"""
+        start_time = time.perf_counter()
+        with open(self.video_path, 'rb') as f:
+            response = requests.post(
+                f"{self.url}/api/upload_video",
+                files={'video': (os.path.basename(self.video_path), f, 'video/mp4')},
+                timeout=300
+            )
+        self.upload_seconds = time.perf_counter() - start_time
+        self.upload_status = response.status_code
+
+    def run(self):
+        try:
+            self.sio.connect(self.url, transports=['websocket'])
+            self.upload()
+
+            if self.upload_status == 200:
+                # Exercise the stream controls on our own session
+                time.sleep(self.pause_after)
+                self.sio.emit('pause_streaming')
+                time.sleep(self.pause_seconds)
+                self.sio.emit('resume_streaming')
+                time.sleep(max(0, self.duration - self.pause_after - self.pause_seconds))
+                self.sio.emit('stop_streaming')
+                self.stopped.wait(timeout=5)
+            else:
+                # Rejected uploads still receive the broadcast frames
+                time.sleep(self.duration)
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            if self.sio.connected:
+                self.sio.disconnect()
+
+    def delivered_fps(self):
+        """Frames per second while frames were actually flowing"""
+        gaps = np.diff(self.frame_times)
+        active_time = gaps[gaps < IDLE_GAP_SECONDS].sum()
+        return len(gaps) / active_time if active_time > 0 else 0.0
+
+
+def read_rss(pid):
+    """Resident memory of a process and all its descendants in bytes, or None if unavailable"""
+    if not os.path.exists('/proc/self/status'):
+        return None
+
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status", 'r') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children", 'r') as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (FileNotFoundError, ProcessLookupError):
+            # The process exited while we were reading it
+            continue
+    return total
+
+def wait_for_server(url, timeout=30):
+    """Poll the config endpoint until the server answers"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{url}/api/config", timeout=1).ok:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    return False
+
+def run_round(client_count, args, video_path, server_pid):
+    """Run one round with client_count concurrent clients and summarize it"""
+    clients = [
+        SimulatedClient(args.url, video_path, args.duration, args.pause_after, args.pause_seconds)
+        for _ in range(client_count)
+    ]
+    threads = [threading.Thread(target=client.run, daemon=True) for client in clients]
+    for thread in threads:
+        thread.start()
+
+    # Sample server memory while the clients run
+    peak_rss = None
+    while any(thread.is_alive() for thread in threads):
+        if server_pid is not None:
+            rss = read_rss(server_pid)
+            if rss is not None:
+                peak_rss = max(peak_rss or 0, rss)
+        time.sleep(0.25)
+
+    upload_times = [c.upload_seconds for c in clients if c.upload_seconds is not None]
+    latencies = np.concatenate([c.latencies for c in clients]) if clients else np.array([])
+    return {
+        'clients': client_count,
+        'accepted': sum(1 for c in clients if c.upload_status == 200),
+        'rejected': sum(1 for c in clients if c.upload_status not in (None, 200)),
+        'errors': sum(1 for c in clients if c.error is not None),
+        'upload_p50_ms': 1000 * np.median(upload_times) if upload_times else float('nan'),
+        'upload_max_ms': 1000 * max(upload_times) if upload_times else float('nan'),
+        'fps': np.mean([c.delivered_fps() for c in clients]),
+        'latency_ms': (1000 * np.percentile(latencies, [50, 95, 99])
+                       if len(latencies) else [float('nan')] * 3),
+        'peak_rss_mb': peak_rss / (1024 * 1024) if peak_rss is not None else float('nan'),
+        'error_messages': sorted({c.error for c in clients if c.error is not None})
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the streaming server with concurrent clients')
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--clients', nargs='+', type=int, default=[1, 2, 4, 8],
+                        help='Client counts to test, one round each')
+    parser.add_argument('--video', help='Video to upload (default: a synthetic clip)')
+    parser.add_argument('--duration', type=float, default=15, help='Seconds each client stays connected')
+    parser.add_argument('--pause-after', type=float, default=4, help='Seconds of streaming before pausing')
+    parser.add_argument('--pause-seconds', type=float, default=2, help='Seconds to stay paused')
+    parser.add_argument('--launch-server', action='store_true', help='Start app.py for the duration of the test')
+    parser.add_argument('--server-pid', type=int, help='PID of an already running server, for memory readings')
+    parser.add_argument('--settle', type=float, default=3, help='Seconds to wait between rounds')
+    args = parser.parse_args()
+
+    tmp_dir = None
+    video_path = args.video
+    if video_path is None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        video_path = os.path.join(tmp_dir.name, 'load_generator.mp4')
+        make_synthetic_clip(video_path, 640, 480, 600)
+
+    server = None
+    server_pid = args.server_pid
+    if args.launch_server:
+        server = subprocess.Popen([sys.executable, 'app.py'],
+                                  cwd=os.path.dirname(os.path.abspath(__file__)))
+        server_pid = server.pid
+
+    try:
+        if not wait_for_server(args.url):
+            print(f"Server at {args.url} is not responding")
+            return 1
+
+        print("The server runs one session at a time: with N > 1 clients, uploads after the first\n"
+              "are rejected (409) and a round measures broadcast fan-out, not N sessions.\n")
+        print(f"{'clients':>7} {'accepted':>8} {'rejected':>8} {'errors':>6} {'upload p50':>11} "
+              f"{'upload max':>11} {'fps':>7} {'lat p50':>8} {'lat p95':>8} {'lat p99':>8} {'rss MB':>8}")
+        for client_count in args.clients:
+            result = run_round(client_count, args, video_path, server_pid)
+            p50, p95, p99 = result['latency_ms']
+            print(f"{result['clients']:>7} {result['accepted']:>8} {result['rejected']:>8} "
+                  f"{result['errors']:>6} {result['upload_p50_ms']:>9.0f}ms {result['upload_max_ms']:>9.0f}ms "
+                  f"{result['fps']:>7.1f} {p50:>6.0f}ms {p95:>6.0f}ms {p99:>6.0f}ms "
+                  f"{result['peak_rss_mb']:>8.1f}")
+            for message in result['error_messages']:
+                print(f"        client error: {message}")
+            time.sleep(args.settle)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+        if tmp_dir is not None:
+            tmp_dir.cleanup()
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,70 @@
+import os
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# The motion index is a compact per-frame summary written by the Detector next
+# to the uploaded video. Each entry holds the number of detection boxes in the
+# frame and the fraction of the frame they cover. It is used to find the
+# segments of a recording that contain motion, so that playback can seek over
+# static stretches instead of decoding, encoding and sending every frame.
+
+INDEX_DTYPE = np.dtype([('boxes', np.uint16), ('area', np.float32)])
+
+def index_path_for(video_path):
+    """Return the path of the motion index stored next to a video"""
+    return os.path.splitext(video_path)[0] + '.motion.npy'
+
+def save_motion_index(index_path, box_counts, areas):
+    """Persist per-frame box counts and covered area fractions"""
+    index = np.empty(len(box_counts), dtype=INDEX_DTYPE)
+    index['boxes'] = box_counts
+    index['area'] = areas
+    np.save(index_path, index)
+    logger.info(f"Saved motion index with {len(index)} frames to {index_path}")
+    return index
+
+def load_motion_index(video_path):
+    """Load the motion index for a video, or None if it has not been built"""
+    index_path = index_path_for(video_path)
+    if not os.path.exists(index_path):
+        return None
+    try:
+        return np.load(index_path)
+    except Exception as e:
+        logger.error(f"Error loading motion index {index_path}: {str(e)}")
+        return None
+
+def motion_segments(index, padding=0, min_area=0.0):
+    """
+    Find the frame ranges that contain motion
+
+    Args:
+        index: Motion index array as returned by load_motion_index
+        padding: Number of frames to include before and after each motion run
+        min_area: Minimum covered area fraction for a frame to count as motion
+
+    Returns:
+        List of (start, end) frame ranges with end exclusive, sorted and
+        non-overlapping
+    """
+    active = (index['boxes'] > 0) & (index['area'] >= min_area)
+    if not active.any():
+        return []
+
+    # Locate the starts and ends of consecutive runs of active frames
+    edges = np.diff(np.concatenate(([0], active.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1) - padding
+    ends = np.flatnonzero(edges == -1) + padding
+    np.clip(starts, 0, len(index), out=starts)
+    np.clip(ends, 0, len(index), out=ends)
+
+    # Merge runs whose padded ranges touch
+    segments = []
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        if segments and start <= segments[-1][1]:
+            segments[-1] = (segments[-1][0], max(segments[-1][1], end))
+        else:
+            segments.append((start, end))
+    return segments
@@ -0,0 +1,195 @@
+import queue
+import logging
+import multiprocessing
+
+try:
+    # Unpatched threading, queue and sleep, even when eventlet has monkey
+    # patched them. Stage threads must be native OS threads so that OpenCV can
+    # run them in parallel while it releases the GIL, and the stages, the
+    # profiler's threads and anything else running on a native thread must
+    # sleep and wait without eventlet's hub.
+    from eventlet.patcher import original
+    native_threading = original('threading')
+    native_queue = original('queue')
+    native_sleep = original('time').sleep
+except ImportError:
+    import threading as native_threading
+    from time import sleep as native_sleep
+    native_queue = queue
+
+logger = logging.getLogger(__name__)
+
+# The Pipeline class wires the Streamer, Detector and Display stages together
+# with bounded queues and runs them on one of two engines. The
+# 'multiprocessing' engine runs each stage in its own process, pickling every
+# frame across process boundaries. The 'threading' engine runs the stages as
+# native threads in the current process and passes frames by reference, which
+# avoids the spawn and pickling overhead on small and medium videos since
+# OpenCV releases the GIL in its decode, detection, blur and encode calls.
+# The stages themselves are unchanged; only the worker and queue types differ.
+# Stage processes are spawned rather than forked: a forked child of the
+# eventlet server inherits its listening socket and greenlets, and goes on to
+# accept client connections and resume other sessions' request handlers. A
+# spawned child imports the server's main module, which only patches and
+# starts the server when run as __main__.
+# Under eventlet's monkey patching, anything a native thread shares with the
+# event loop must use unpatched primitives: green locks and sleeps taken on a
+# native thread run a separate hub there and can wait forever. The stages only
+# share queues (native), the stop event (native) and logging, whose locks a
+# monkey patched process swaps for native ones once at startup.
+
+ENGINES = ['multiprocessing', 'threading']
+STAGES = ['streamer', 'detector', 'display']
+
+# Context for every process and queue that stage processes use
+mp_context = multiprocessing.get_context('spawn')
+
+
+class Pipeline:
+    def __init__(self, engine, queue_sizes):
+        """
+        Create the queues for a pipeline run
+
+        Args:
+            engine: One of ENGINES
+            queue_sizes: The 'queue_sizes' processing configuration section
+        """
+        if engine == 'multiprocessing':
+            self.worker_class = mp_context.Process
+            queue_class = mp_context.Queue
+            self.stop_event = mp_context.Event()
+        elif engine == 'threading':
+            self.worker_class = native_threading.Thread
+            queue_class = native_queue.Queue
+            self.stop_event = native_threading.Event()
+        else:
+            raise ValueError(f"Unknown pipeline engine: {engine}")
+
+        self.engine = engine
+        self.queue_sizes = queue_sizes
+        self.workers = []
+
+        # Frame queues between stages
+        self.frames_queue = queue_class(maxsize=queue_sizes.get('frames_queue', 0))
+        self.detection_queue = queue_class(maxsize=queue_sizes.get('detection_queue', 0))
+        self.stream_queue = queue_class(maxsize=queue_sizes.get('stream_queue', 10))
+
+        # Control queues carry live config updates into the stages
+        self.control_queues = {stage: queue_class() for stage in STAGES}
+
+        # Profile queues let admins profile each stage while it runs
+        self.profile_queues = {stage: queue_class() for stage in STAGES}
+
+    def start(self, video_path, streamer_config, detector_config, display_config,
+              segments=None, index_path=None):
+        """Start the Streamer, Detector and Display workers"""
+        from streamer import Streamer
+        from detector import Detector
+        from display import Display
+
+        # Stages update their configs in place, which threads would otherwise
+        # do on the shared application config
+        streamer_config = dict(streamer_config)
+        detector_config = dict(detector_config)
+        display_config = dict(display_config)
+
+        self.workers = [
+            self.worker_class(
+                target=Streamer,
+                args=(self.frames_queue, video_path, streamer_config, segments,
+                      self.profile_queues['streamer'], self.stop_event,
+                      self.control_queues['streamer'])
+            ),
+            self.worker_class(
+                target=Detector,
+                args=(self.frames_queue, self.detection_queue, detector_config,
+                      self.control_queues['detector'], index_path,
+                      self.profile_queues['detector'])
+            ),
+            self.worker_class(
+                target=Display,
+                args=(self.detection_queue, self.stream_queue, display_config,
+                      self.control_queues['display'], self.profile_queues['display'])
+            )
+        ]
+
+        for worker in self.workers:
+            if self.engine == 'threading':
+                # Don't let a stage blocked on a queue keep the server from exiting
+                worker.daemon = True
+            worker.start()
+        logger.info(f"Pipeline started with {self.engine} engine")
+
+    def is_alive(self):
+        """Return True while any stage is still running"""
+        return any(worker.is_alive() for worker in self.workers)
+
+    def stage_alive(self, stage):
+        """Return True while the named stage is still running"""
+        return bool(self.workers) and self.workers[STAGES.index(stage)].is_alive()
+
+    def queue_depths(self):
+        """Return (depth, maxsize) for each frame queue"""
+        return {
+            'frames_queue': (queue_depth(self.frames_queue), self.queue_sizes.get('frames_queue', 0)),
+            'detection_queue': (queue_depth(self.detection_queue), self.queue_sizes.get('detection_queue', 0)),
+            'stream_queue': (queue_depth(self.stream_queue), self.queue_sizes.get('stream_queue', 10))
+        }
+
+    def stop(self):
+        """
+        Ask the stages to wind down
+
+        The Streamer stops reading and sends the termination signal, and any
+        frames still queued are discarded so that no stage stays blocked on a
+        full queue. Threads cannot be killed, so this is the only way to end
+        a threading run early; call it repeatedly until is_alive() is False.
+        """
+        self.stop_event.set()
+        for frame_queue in (self.frames_queue, self.detection_queue, self.stream_queue):
+            saw_termination = False
+            while True:
+                try:
+                    item = frame_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    saw_termination = True
+
+            # Keep the termination signal flowing to the next stage
+            if saw_termination:
+                frame_queue.put(None)
+
+    def terminate(self):
+        """Stop all stages, forcibly where the engine allows it"""
+        self.stop()
+        if self.engine == 'multiprocessing':
+            for worker in self.workers:
+                if worker.is_alive():
+                    worker.terminate()
+
+
+def use_native_logging_locks():
+    """
+    Replace the logging module's locks with native ones
+
+    eventlet.monkey_patch() turns existing locks green, including the ones
+    every log call takes, so a stage thread and a greenlet logging at the same
+    time could deadlock. Log handlers never yield while holding their lock, so
+    native locks are also safe for greenlets. A monkey patched process calls
+    this once, after logging is configured and before a threading pipeline
+    starts.
+    """
+    logging._lock = native_threading.RLock()
+    for handler_ref in list(logging._handlerList):
+        handler = handler_ref()
+        if handler is not None:
+            handler.lock = native_threading.RLock()
+
+def queue_depth(frame_queue):
+    """Return the approximate number of items in a queue, or None if unsupported"""
+    try:
+        return frame_queue.qsize()
+    except NotImplementedError:
+        # qsize() is not available on some platforms (e.g. macOS)
+        return None
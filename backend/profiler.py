@@ -0,0 +1,176 @@
+import os
+import sys
+import time
+import queue
+import signal
+import cProfile
+import logging
+from collections import Counter
+# The sampler and watchdog must be native threads to observe the stage and
+# keep time while it blocks
+from pipeline import native_threading as threading
+
+logger = logging.getLogger(__name__)
+
+# The StageProfiler class lets an admin profile a running pipeline stage
+# without restarting it. Each stage owns one and calls poll() once per
+# frame. A request taken from the profile queue starts either cProfile or a
+# sampling profiler for the requested number of seconds. A native watchdog
+# thread ends the run at its deadline, even while the stage is blocked on a
+# queue or paused, and writes the results to the requested file (pstats for
+# cProfile, collapsed stacks for the sampler) so they can be fetched through
+# the API. A stage that exits or is terminated writes what it has so far, and
+# requests it never got to are answered with an empty profile.
+
+PROFILE_MODES = ['cprofile', 'sampling']
+
+
+class StageProfiler:
+    def __init__(self, stage, request_queue=None):
+        self.stage = stage
+        self.request_queue = request_queue
+        self.request = None
+        self.profile = None
+        self.samples = None
+        self.finished = False
+        self.done_event = None
+        self.watchdog = None
+        self.previous_sigterm = None
+        # Reentrant: the SIGTERM handler may run while this thread holds it
+        self.lock = threading.RLock()
+
+    def poll(self):
+        """Clean up a finished profiling run, then start the next requested one"""
+        if self.request_queue is None:
+            return
+
+        if self.request is not None:
+            if not self.finished:
+                return
+            self._cleanup()
+
+        try:
+            request = self.request_queue.get_nowait()
+        except queue.Empty:
+            return
+        self.start(request)
+
+    def start(self, request):
+        """
+        Start profiling this process
+
+        Args:
+            request: Dictionary with 'mode', 'seconds', 'path' and, for the
+                     sampling mode, 'interval' in seconds
+        """
+        self.request = request
+        self.finished = False
+        self.done_event = threading.Event()
+        deadline = time.monotonic() + request['seconds']
+
+        if request['mode'] == 'sampling':
+            self.samples = Counter()
+            self.watchdog = threading.Thread(
+                target=self._sample,
+                args=(threading.get_ident(), request.get('interval', 0.005), deadline),
+                daemon=True
+            )
+        else:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+            self.watchdog = threading.Thread(target=self._watch, args=(deadline,), daemon=True)
+        self.watchdog.start()
+
+        # Write the profile before the process is terminated, where the stage
+        # runs on the main thread of its own process
+        try:
+            self.previous_sigterm = signal.signal(signal.SIGTERM, self._on_terminate)
+        except ValueError:
+            self.previous_sigterm = None
+
+        logger.info(f"{self.stage}: {request['mode']} profiling started for {request['seconds']}s")
+
+    def stop(self):
+        """Write out the current run and answer pending requests; call when the stage exits"""
+        if self.request is not None:
+            self._finish()
+            self._cleanup()
+
+        if self.request_queue is None:
+            return
+        while True:
+            try:
+                request = self.request_queue.get_nowait()
+            except queue.Empty:
+                return
+            logger.info(f"{self.stage}: exited before profiling, writing an empty profile")
+            self._write(request['path'], cProfile.Profile() if request['mode'] == 'cprofile' else None,
+                        Counter())
+
+    def _finish(self):
+        """Write the current run's output once, from whichever thread gets here first"""
+        with self.lock:
+            if self.finished:
+                return
+            self.finished = True
+            self.done_event.set()
+            # cProfile keeps collecting on the stage thread until _cleanup()
+            # disables it there; dump_stats() writes a snapshot
+            self._write(self.request['path'], self.profile, self.samples)
+
+    def _cleanup(self):
+        """Disable the profiler on the stage's own thread and reset for the next run"""
+        if self.profile is not None:
+            self.profile.disable()
+        if self.previous_sigterm is not None:
+            signal.signal(signal.SIGTERM, self.previous_sigterm)
+        self.request = None
+        self.profile = None
+        self.samples = None
+        self.watchdog = None
+        self.previous_sigterm = None
+
+    def _write(self, path, profile, samples):
+        tmp_path = path + '.tmp'
+        try:
+            if profile is not None:
+                profile.dump_stats(tmp_path)
+            else:
+                with open(tmp_path, 'w') as f:
+                    for stack, count in samples.most_common():
+                        f.write(f"{stack} {count}\n")
+
+            # Only expose complete files to the API
+            os.replace(tmp_path, path)
+            logger.info(f"{self.stage}: profile written to {path}")
+        except Exception as e:
+            logger.error(f"{self.stage}: error writing profile {path}: {str(e)}")
+
+    def _on_terminate(self, signum, frame):
+        """Write the running profile, then let the signal terminate the process"""
+        self._finish()
+        signal.signal(signum, self.previous_sigterm or signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+
+    def _watch(self, deadline):
+        """End a cProfile run at its deadline unless it finished earlier"""
+        if not self.done_event.wait(max(0.0, deadline - time.monotonic())):
+            self._finish()
+
+    def _sample(self, thread_id, interval, deadline):
+        """Periodically record the stack of the stage's thread until the deadline"""
+        while not self.done_event.wait(interval):
+            if time.monotonic() >= deadline:
+                self._finish()
+                return
+
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                with self.lock:
+                    if not self.finished:
+                        self.samples[';'.join(reversed(stack))] += 1
@@ -1,14 +1,30 @@
 from flask import send_from_directory, jsonify, request
 import os
+import hmac
+import json
 import logging
 from file_manager import cleanup_video_file, generate_unique_filename, is_valid_video_format
 import video_processor
+from profiler import PROFILE_MODES
+import sweep
 
 logger = logging.getLogger(__name__)
 
+PLAYBACK_MODES = ['full', 'motion_only']
+
 def register_routes(app, socketio, app_config):
     """Register all API routes"""
     
+    def upload_path(filename):
+        """Return the path of an uploaded video, or None for unknown or unsafe names"""
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        if not filename or os.path.basename(filename) != filename or not os.path.isfile(filepath):
+            return None
+        # The upload folder also holds motion indexes and other side files
+        if not is_valid_video_format(filename, app_config['server']['valid_video_formats']):
+            return None
+        return filepath
+    
     @app.route('/')
     def index():
         """Serve the static React app"""
@@ -33,6 +49,12 @@ def register_routes(app, socketio, app_config):
             logger.warning("Attempted upload while processing is active")
             return jsonify({'status': 'error', 'message': 'Video processing already in progress'}), 409
         
+        # Optional playback mode, defaults to the configured mode
+        playback_mode = request.form.get('playback')
+        if playback_mode is not None and playback_mode not in PLAYBACK_MODES:
+            logger.warning(f"Unsupported playback mode: {playback_mode}")
+            return jsonify({'status': 'error', 'message': 'Unsupported playback mode'}), 400
+        
         try:
             # Get valid video formats from config
             valid_formats = app_config['server']['valid_video_formats']
@@ -51,13 +73,26 @@ def register_routes(app, socketio, app_config):
             file.save(filepath)
             logger.info(f"Video uploaded to {filepath}")
             
+            # Another upload may have started a session while this one was saved
+            if not video_processor.claim_processing():
+                logger.warning("Upload finished while processing became active")
+                cleanup_video_file(filepath)
+                return jsonify({'status': 'error', 'message': 'Video processing already in progress'}), 409
+            
             # Start processing and streaming in background
-            socketio.start_background_task(
-                    video_processor.process_and_stream_video, 
-                    filepath, 
-                    app_config, 
-                    socketio
-                )
+            try:
+                socketio.start_background_task(
+                        video_processor.process_and_stream_video, 
+                        filepath, 
+                        app_config, 
+                        socketio,
+                        playback_mode
+                    )
+            except Exception:
+                # Nothing will clear the claim or delete the upload otherwise
+                video_processor.release_processing()
+                cleanup_video_file(filepath)
+                raise
             
             return jsonify({
                 'status': 'success', 
@@ -68,6 +103,152 @@ def register_routes(app, socketio, app_config):
             logger.error(f"Error during upload: {str(e)}")
             return jsonify({'status': 'error', 'message': f'Upload error: {str(e)}'}), 500
     
+    @app.route('/api/replay_video', methods=['POST'])
+    def replay_video():
+        """Stream a previously uploaded video again, optionally motion segments only"""
+        data = request.get_json(silent=True) or {}
+        filename = data.get('filename', '')
+        playback_mode = data.get('playback', 'motion_only')
+        
+        if playback_mode not in PLAYBACK_MODES:
+            logger.warning(f"Unsupported playback mode: {playback_mode}")
+            return jsonify({'status': 'error', 'message': 'Unsupported playback mode'}), 400
+        
+        # Only accept bare filenames inside the upload folder
+        filepath = upload_path(filename)
+        if filepath is None:
+            logger.warning(f"Replay requested for unknown video: {filename}")
+            return jsonify({'status': 'error', 'message': 'Video not found'}), 404
+        
+        # Check if processing is already happening
+        if not video_processor.claim_processing():
+            logger.warning("Attempted replay while processing is active")
+            return jsonify({'status': 'error', 'message': 'Video processing already in progress'}), 409
+        
+        try:
+            socketio.start_background_task(
+                    video_processor.process_and_stream_video, 
+                    filepath, 
+                    app_config, 
+                    socketio,
+                    playback_mode
+                )
+        except Exception as e:
+            video_processor.release_processing()
+            logger.error(f"Error starting replay: {str(e)}")
+            return jsonify({'status': 'error', 'message': f'Replay error: {str(e)}'}), 500
+        
+        return jsonify({
+            'status': 'success', 
+            'message': f'Replay started in {playback_mode} mode',
+            'filename': filename
+        })
+    
+    @app.route('/api/sweep', methods=['POST'])
+    def start_sweep():
+        """Evaluate a grid of detector configs over an uploaded video in one pass"""
+        data = request.get_json(silent=True) or {}
+        filename = data.get('filename', '')
+        
+        filepath = upload_path(filename)
+        if filepath is None:
+            logger.warning(f"Sweep requested for unknown video: {filename}")
+            return jsonify({'status': 'error', 'message': 'Video not found'}), 404
+        
+        try:
+            job_id = sweep.start_sweep_job(filepath, app_config, data.get('grid'))
+        except ValueError as e:
+            logger.warning(f"Sweep request rejected: {str(e)}")
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        if job_id is None:
+            logger.warning("Sweep request rejected: too many sweeps running")
+            return jsonify({'status': 'error', 'message': 'Too many sweeps running'}), 409
+        
+        return jsonify({'status': 'success', 'message': 'Sweep started', 'job_id': job_id})
+    
+    @app.route('/api/sweep/<job_id>', methods=['GET'])
+    def get_sweep(job_id):
+        """Return a sweep report, or its status while it is still running"""
+        status = sweep.sweep_job_status(app_config, job_id)
+        if status is None:
+            return jsonify({'status': 'error', 'message': 'Unknown sweep job'}), 404
+        
+        report_path = sweep.sweep_report_path(app_config, job_id)
+        if not os.path.exists(report_path):
+            if status == 'running':
+                return jsonify({'status': 'running', 'job_id': job_id}), 202
+            return jsonify({'status': 'error', 'message': 'Sweep ended without a report'}), 500
+        
+        with open(report_path, 'r') as f:
+            report = json.load(f)
+        return jsonify({'status': 'success', 'job_id': job_id, 'report': report})
+    
+    def is_admin_request():
+        """Check the admin token; admin endpoints are disabled until one is configured"""
+        token = app_config.get('profiling', {}).get('admin_token')
+        if not token:
+            return False
+        return hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token)
+    
+    @app.route('/api/admin/profile', methods=['POST'])
+    def start_profile():
+        """Profile a running pipeline stage for a number of seconds"""
+        if not is_admin_request():
+            return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
+        
+        profiling_config = app_config.get('profiling', {})
+        data = request.get_json(silent=True) or {}
+        stage = data.get('stage', '')
+        mode = data.get('mode', 'cprofile')
+        
+        if mode not in PROFILE_MODES:
+            return jsonify({'status': 'error', 'message': f'Unsupported profiling mode: {mode}'}), 400
+        try:
+            seconds = float(data.get('seconds', 10))
+        except (TypeError, ValueError):
+            return jsonify({'status': 'error', 'message': 'Invalid profiling duration'}), 400
+        if not 0 < seconds <= profiling_config.get('max_seconds', 60):
+            return jsonify({'status': 'error', 'message': 'Profiling duration out of range'}), 400
+        
+        try:
+            filename = video_processor.request_profile(
+                stage,
+                mode,
+                seconds,
+                profiling_config.get('output_dir', 'profiles'),
+                profiling_config.get('sample_interval', 0.005)
+            )
+        except ValueError as e:
+            logger.warning(f"Profiling request rejected: {str(e)}")
+            return jsonify({'status': 'error', 'message': str(e)}), 409
+        
+        return jsonify({
+            'status': 'success',
+            'message': f'Profiling {stage} for {seconds}s',
+            'filename': filename
+        })
+    
+    @app.route('/api/admin/profiles', methods=['GET'])
+    def list_profiles():
+        """List the profiles written so far"""
+        if not is_admin_request():
+            return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
+        
+        output_dir = app_config.get('profiling', {}).get('output_dir', 'profiles')
+        profiles = []
+        if os.path.isdir(output_dir):
+            profiles = sorted(name for name in os.listdir(output_dir) if not name.endswith('.tmp'))
+        return jsonify({'status': 'success', 'profiles': profiles})
+    
+    @app.route('/api/admin/profiles/<path:filename>', methods=['GET'])
+    def get_profile(filename):
+        """Download a profile; returns 404 until the profiling run has finished"""
+        if not is_admin_request():
+            return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
+        
+        output_dir = app_config.get('profiling', {}).get('output_dir', 'profiles')
+        return send_from_directory(os.path.abspath(output_dir), filename, as_attachment=True)
+    
     # Add a new endpoint to expose configuration to frontend
     @app.route('/api/config', methods=['GET'])
     def get_frontend_config():
@@ -1,58 +1,184 @@
 import cv2
 import time
+import queue
 import logging
+# Pace with a real sleep: on the threading engine the Streamer runs on a
+# native thread, where eventlet's patched sleep would start a hub of its own
+from pipeline import native_sleep as sleep
+from profiler import StageProfiler
+from frame_cache import FrameCache
 
 logger = logging.getLogger(__name__)
 
+# Sent just before the termination signal when every requested frame was read,
+# so that downstream stages can tell a complete pass from a stopped or failed one
+END_OF_VIDEO = 'end_of_video'
+
 # The Streamer class is responsible for reading a video file frame by frame and
 # sending each frame to the Detector process. It uses OpenCV to handle video
 # capture and applies a small delay between frames to manage the flow of data
-# through the pipeline. If the video cannot be opened or ends, it signals the
-# other processes to terminate by sending a None value through the queue.
+# through the pipeline. Each frame travels with a dictionary of timings that
+# downstream stages extend: its wall-clock capture time and the seconds each
+# stage spent on it. If the video cannot be opened or ends,
+# it signals the other processes to terminate by sending a None value through
+# the queue, preceded by END_OF_VIDEO if the stream was read to its end. When a list of (start, end) frame segments is given, only those
+# frames are read, seeking over everything in between. Profiling requests from
+# the optional profile queue are served between frames, and setting the
+# optional stop event ends the stream early. With the frame cache enabled, the
+# first full read of a video stores the decoded frames and later runs read them
+# from the memory-mapped cache instead of decoding again; a failure to write
+# the cache drops the entry but not the stream. The delay between
+# frames can be changed while running through the optional control queue.
 
 class Streamer:
-    def __init__(self, output_queue, video_path, config):
+    def __init__(self, output_queue, video_path, config, segments=None, profile_queue=None,
+                 stop_event=None, control_queue=None):
         self.output_queue = output_queue
         self.video_path = video_path
         self.config = config
+        self.segments = segments
+        self.stop_event = stop_event
+        self.control_queue = control_queue
+        self.profiler = StageProfiler('streamer', profile_queue)
         self.process_video()
-        
-    def process_video(self):
-        # Open the video
-        try:
-            cap = cv2.VideoCapture(self.video_path)
-            
-            if not cap.isOpened():
-                logger.error(f"Error: Could not open video at {self.video_path}")
-                # Signal other processes to terminate by sending None
-                self.output_queue.put(None)
+
+    def stopped(self):
+        """Check whether the pipeline asked the stream to end early"""
+        return self.stop_event is not None and self.stop_event.is_set()
+
+    def apply_control_updates(self):
+        """Apply config updates pushed through the control queue, if any"""
+        if self.control_queue is None:
+            return
+        while True:
+            try:
+                update = self.control_queue.get_nowait()
+            except queue.Empty:
                 return
-                
-            # Process frame by frame
-            frame_count = 0
-            while True:
+            self.config.update(update)
+            logger.info(f"Streamer config updated: {update}")
+
+    def read_capture(self, cap, segments):
+        """Yield (frame, read_time) from the video, seeking to each segment"""
+        for start, end in segments:
+            # Seek to the segment start unless we are already there
+            if start != int(cap.get(cv2.CAP_PROP_POS_FRAMES)):
+                cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+            position = start
+            while end is None or position < end:
+                read_start = time.perf_counter()
                 ret, frame = cap.read()
-                
+                read_time = time.perf_counter() - read_start
+
                 # If frame is read correctly, ret is True
                 if not ret:
-                    logger.info(f"End of video stream after {frame_count} frames")
+                    break
+                yield frame, read_time
+                position += 1
+
+    def read_cache(self, cached_frames, segments):
+        """Yield (frame, read_time) from the frame cache, seeking to each segment"""
+        for start, end in segments:
+            end = len(cached_frames) if end is None else min(end, len(cached_frames))
+            for position in range(start, end):
+                read_start = time.perf_counter()
+                frame = cached_frames[position]
+                yield frame, time.perf_counter() - read_start
+
+    def process_video(self):
+        cap = None
+        cache_writer = None
+        try:
+            # Without segments, read the whole video from the start
+            segments = self.segments if self.segments is not None else [(0, None)]
+
+            # Look the video up in the frame cache if it is enabled
+            cache = None
+            cached_frames = None
+            cache_config = self.config.get('frame_cache', {})
+            if cache_config.get('enabled', False):
+                cache = FrameCache(cache_config.get('directory', 'frame_cache'),
+                                   cache_config.get('max_size_mb', 2048) * 1024 * 1024)
+                cache_key = cache.key_for(self.video_path)
+                cached_frames = cache.open(cache_key)
+
+            if cached_frames is not None:
+                frames = self.read_cache(cached_frames, segments)
+            else:
+                # Open the video
+                cap = cv2.VideoCapture(self.video_path)
+
+                if not cap.isOpened():
+                    logger.error(f"Error: Could not open video at {self.video_path}")
                     # Signal other processes to terminate by sending None
                     self.output_queue.put(None)
+                    return
+                frames = self.read_capture(cap, segments)
+
+            # Only a complete, uninterrupted decode can populate the cache
+            should_cache = cache is not None and cached_frames is None and self.segments is None
+
+            # Process frame by frame
+            frame_count = 0
+            for frame, read_time in frames:
+                captured_at = time.time()
+                if self.stopped():
+                    logger.info("Streaming stopped on request")
                     break
-                    
-                # Send the frame to the detector
-                self.output_queue.put(frame)
+                self.apply_control_updates()
+                self.profiler.poll()
+
+                # Store the decoded frame before downstream stages draw on it
+                if should_cache:
+                    if cache_writer is None:
+                        expected_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+                        cache_writer = cache.writer(cache_key, frame.shape, expected_frames)
+                        should_cache = cache_writer is not None
+                    if cache_writer is not None:
+                        try:
+                            cache_writer.write(frame)
+                        except (ValueError, OSError) as e:
+                            # A full disk or an odd frame only costs the cache
+                            # entry, never the stream
+                            logger.error(f"Error writing the frame cache, not caching: {str(e)}")
+                            cache_writer.abort()
+                            cache_writer = None
+                            should_cache = False
+
+                # Send the frame to the detector along with its stage timings
+                self.output_queue.put((frame, {'streamer': read_time, 'captured_at': captured_at}))
                 frame_count += 1
-                
+
                 # Small delay to prevent overwhelming the queue
-                time.sleep(self.config.get('sleep_delay', 0.01))
-                
+                sleep(self.config.get('sleep_delay', 0.01))
+
+            if cache_writer is not None and not self.stopped():
+                try:
+                    cache.commit(cache_writer)
+                    cache_writer = None
+                except OSError as e:
+                    logger.error(f"Error committing the frame cache: {str(e)}")
+
+            logger.info(f"End of video stream after {frame_count} frames")
+            if not self.stopped():
+                self.output_queue.put(END_OF_VIDEO)
+            # Signal other processes to terminate by sending None
+            self.output_queue.put(None)
+
         except Exception as e:
             logger.error(f"Error in video streaming: {str(e)}")
             # Signal error to other processes
             self.output_queue.put(None)
         finally:
+            # Write out any profile still in progress
+            self.profiler.stop()
+
+            # Drop a cache entry that was not completed
+            if cache_writer is not None:
+                cache_writer.abort()
+
             # Always release the video capture object
-            if 'cap' in locals() and cap is not None:
+            if cap is not None:
                 cap.release()
-                logger.info("Video capture released") 
\ No newline at end of file
+                logger.info("Video capture released")
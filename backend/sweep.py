@@ -0,0 +1,549 @@
+"""
+Parameter sweep: evaluate a grid of detector configs in a single decoding pass.
+
+The video is decoded once by a Streamer whose output is fanned out to K
+Detector processes, one per config in the grid, running in parallel. Each
+frame is copied once into a shared-memory ring and the Detectors are only sent
+its slot, so the frame is not pickled and piped K times. The
+Detectors send back only their detections and per-frame cost, never the
+frames, and the results are summarized per config into one report: detection
+counts, box statistics and detector time per frame. With the frame cache
+enabled, repeated sweeps over the same clip skip decoding entirely.
+
+Usage:
+    python sweep.py video.mp4 --grid '{"min_contour_area": [5, 20], "morph_kernel_size": [3, 5]}' [--output report.json]
+"""
+import os
+import sys
+import json
+import math
+import time
+import queue
+import uuid
+import argparse
+import itertools
+import logging
+import threading
+import subprocess
+import numpy as np
+from multiprocessing import Process, Queue, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from streamer import END_OF_VIDEO
+
+logger = logging.getLogger(__name__)
+
+# Detector settings that can be swept, as name -> (integer only, upper bound).
+# Every value must be positive.
+SWEEP_PARAMETERS = {
+    'min_contour_area': (False, None),
+    'frames_to_stabilize': (True, None),
+    'morph_kernel_size': (True, None),
+    'detection_downscale': (False, 1.0),
+    'detection_stride': (True, None)
+}
+
+# Seconds to wait for results before checking that the Detectors are alive
+RESULT_TIMEOUT = 1.0
+
+# Where POSIX shared memory lives. Containers often limit it to 64 MB.
+SHARED_MEMORY_DIR = '/dev/shm'
+
+# Config sections a sweep job is started with. The rest of the app config,
+# such as the admin token, is kept out of the files it writes.
+SWEEP_CONFIG_SECTIONS = ['detector', 'streamer', 'processing', 'sweep']
+
+# Sweep jobs started by the server: the processes of running ones and the exit
+# codes of finished ones whose files are kept, keyed by job id
+sweep_jobs = {}
+finished_sweep_jobs = {}
+jobs_lock = threading.Lock()
+
+
+class SharedFrameRing:
+    """
+    Queue-like object that hands every frame to several Detector processes
+
+    Frames are written into a ring of slots in shared memory, created on the
+    first frame, and only the slot is put on each Detector's queue. A slot is
+    written again once every Detector has acknowledged reading it. Detectors
+    that die are skipped. A ring that does not fit in the free shared memory
+    is not created; the error is kept in `error`, as the Streamer writing to
+    the ring only logs it.
+    """
+    def __init__(self, reader_count, slots):
+        self.slots = slots
+        self.queues = [Queue(maxsize=slots) for _ in range(reader_count)]
+        self.ack_queue = Queue()
+        self.processes = []
+        self.failed = set()
+        self.memory = None
+        self.error = None
+        self.frame_bytes = 0
+        self.next_slot = 0
+
+        # Slot -> readers that have not acknowledged it yet
+        self.pending = {}
+
+        # Start the tracker of shared memory before the Detectors are started,
+        # so that they share it. A Detector starting its own would unlink the
+        # ring when that Detector exits.
+        resource_tracker.ensure_running()
+
+    def reader(self, index):
+        """Return the input queue for the Detector with this index"""
+        return SharedFrameReader(self.queues[index], self.ack_queue, index)
+
+    def watch(self, processes):
+        """Set the Detector processes, checked for liveness while waiting on them"""
+        self.processes = processes
+
+    def put(self, item):
+        if item == END_OF_VIDEO:
+            # Sweep Detectors build no motion index
+            return
+        if item is None:
+            for i in range(len(self.queues)):
+                self._send(i, None)
+            return
+
+        frame, timings = item
+        if self.memory is None:
+            size = frame.nbytes * self.slots
+            free = shared_memory_free()
+            if free is not None and size > free:
+                self.error = ValueError(
+                    f"A ring of {self.slots} frames needs {size} bytes of shared memory, "
+                    f"only {free} are free; lower sweep.ring_slots")
+                raise self.error
+            self.frame_bytes = frame.nbytes
+            self.memory = SharedMemory(create=True, size=size)
+        elif frame.nbytes != self.frame_bytes:
+            raise ValueError(f"Frame size changed from {self.frame_bytes} to {frame.nbytes} bytes")
+
+        slot = self._acquire_slot()
+        view = np.ndarray(frame.shape, frame.dtype, buffer=self.memory.buf,
+                          offset=slot * self.frame_bytes)
+        view[:] = frame
+        del view
+
+        message = (self.memory.name, slot, frame.shape, frame.dtype.str, timings)
+        readers = [i for i in range(len(self.queues)) if i not in self.failed]
+        self.pending[slot] = set(readers)
+        for i in readers:
+            self._send(i, message)
+
+    def close(self):
+        """Release the shared memory once the Detectors are done with it"""
+        if self.memory is not None:
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+    def _acquire_slot(self):
+        """Return the next slot, waiting until every live Detector has read it"""
+        slot = self.next_slot
+        self._read_acks(block=False)
+        while self.pending.get(slot):
+            self._read_acks(block=True)
+        self.next_slot = (slot + 1) % self.slots
+        return slot
+
+    def _read_acks(self, block):
+        try:
+            while True:
+                reader, slot = self.ack_queue.get(timeout=RESULT_TIMEOUT) if block \
+                    else self.ack_queue.get_nowait()
+                self.pending[slot].discard(reader)
+                block = False
+        except queue.Empty:
+            if block:
+                self._check_readers()
+
+    def _send(self, index, message):
+        # Skip Detectors that died; their queues would stay full forever
+        while index not in self.failed:
+            try:
+                self.queues[index].put(message, timeout=RESULT_TIMEOUT)
+                return
+            except queue.Full:
+                self._check_readers()
+
+    def _check_readers(self):
+        """Stop waiting on Detectors that have died"""
+        for i, process in enumerate(self.processes):
+            if i not in self.failed and not process.is_alive():
+                self.failed.add(i)
+                self.queues[i].cancel_join_thread()
+                for readers in self.pending.values():
+                    readers.discard(i)
+
+
+class SharedFrameReader:
+    """Detector input queue that reads the frames a SharedFrameRing announces"""
+    def __init__(self, index_queue, ack_queue, index):
+        self.index_queue = index_queue
+        self.ack_queue = ack_queue
+        self.index = index
+        self.memory = None
+
+    def get(self):
+        message = self.index_queue.get()
+        if message is None:
+            if self.memory is not None:
+                self.memory.close()
+                self.memory = None
+            return None
+
+        name, slot, shape, dtype, timings = message
+        if self.memory is None:
+            self.memory = SharedMemory(name=name)
+
+        # Copy the frame out so that its slot can be written again
+        dtype = np.dtype(dtype)
+        frame_bytes = int(np.prod(shape)) * dtype.itemsize
+        frame = np.ndarray(shape, dtype, buffer=self.memory.buf, offset=slot * frame_bytes).copy()
+        self.ack_queue.put((self.index, slot))
+        return frame, timings
+
+
+class DetectionStatsQueue:
+    """Detector output queue that forwards detections and cost instead of frames"""
+    def __init__(self, result_queue, config_index):
+        self.result_queue = result_queue
+        self.config_index = config_index
+
+    def put(self, item):
+        if item is None:
+            self.result_queue.put((self.config_index, None))
+            return
+
+        frame, detections, timings = item
+        frame_area = frame.shape[0] * frame.shape[1]
+        self.result_queue.put((self.config_index, (
+            detections,
+            timings.get('detector', 0.0),
+            frame_area
+        )))
+
+
+def shared_memory_free():
+    """Return the free bytes of shared memory, or None where it cannot be told"""
+    try:
+        stats = os.statvfs(SHARED_MEMORY_DIR)
+    except (AttributeError, OSError):
+        return None
+    return stats.f_bavail * stats.f_frsize
+
+def validate_grid(grid, max_configs=None):
+    """
+    Check a parameter grid
+
+    Raises:
+        ValueError: If the grid is malformed, uses unknown parameters or
+                    expands to more than max_configs configs
+    """
+    if not isinstance(grid, dict) or not grid:
+        raise ValueError("Grid must be a non-empty object of parameter -> list of values")
+
+    unknown = [name for name in grid if name not in SWEEP_PARAMETERS]
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters: {unknown}")
+
+    for name, values in grid.items():
+        if not isinstance(values, list) or not values:
+            raise ValueError(f"Values for {name} must be a non-empty list")
+
+        integer_only, upper_bound = SWEEP_PARAMETERS[name]
+        for value in values:
+            if (isinstance(value, bool) or not isinstance(value, (int, float))
+                    or not math.isfinite(value)):
+                raise ValueError(f"Values for {name} must be numbers, got {value!r}")
+            if integer_only and not isinstance(value, int):
+                raise ValueError(f"Values for {name} must be integers, got {value!r}")
+            if value <= 0 or (upper_bound is not None and value > upper_bound):
+                bounds = f"in (0, {upper_bound}]" if upper_bound is not None else "positive"
+                raise ValueError(f"Values for {name} must be {bounds}, got {value!r}")
+
+    config_count = int(np.prod([len(values) for values in grid.values()]))
+    if max_configs is not None and config_count > max_configs:
+        raise ValueError(f"Grid expands to {config_count} configs, the limit is {max_configs}")
+
+def expand_grid(base_config, grid):
+    """Return (parameters, detector config) for every combination in the grid"""
+    names = list(grid)
+    configs = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        parameters = dict(zip(names, values))
+        configs.append((parameters, dict(base_config, **parameters)))
+    return configs
+
+def summarize(parameters, results):
+    """Summarize one config's per-frame results"""
+    box_counts = np.array([len(detections) for detections, _, _ in results], dtype=np.int64)
+    box_areas = np.array([w * h for detections, _, _ in results for _, _, w, h in detections],
+                         dtype=np.float64)
+    covered = np.array([sum(w * h for _, _, w, h in detections) / frame_area
+                        for detections, _, frame_area in results], dtype=np.float64)
+    detector_ms = 1000 * np.array([seconds for _, seconds, _ in results], dtype=np.float64)
+
+    return {
+        'parameters': parameters,
+        'frames': len(results),
+        'frames_with_motion': int(np.count_nonzero(box_counts)),
+        'total_boxes': int(box_counts.sum()),
+        'boxes_per_frame': float(box_counts.mean()) if len(results) else 0.0,
+        'max_boxes': int(box_counts.max()) if len(results) else 0,
+        'box_area_mean_px': float(box_areas.mean()) if len(box_areas) else 0.0,
+        'box_area_median_px': float(np.median(box_areas)) if len(box_areas) else 0.0,
+        'box_area_max_px': float(box_areas.max()) if len(box_areas) else 0.0,
+        'covered_area_mean': float(covered.mean()) if len(results) else 0.0,
+        'detector_ms_mean': float(detector_ms.mean()) if len(results) else 0.0,
+        'detector_ms_p95': float(np.percentile(detector_ms, 95)) if len(results) else 0.0
+    }
+
+def run_sweep(video_path, app_config, grid):
+    """
+    Run every config in the grid over one decoding pass of the video
+
+    Returns:
+        The sweep report as a dictionary
+    """
+    from streamer import Streamer
+    from detector import Detector
+
+    configs = expand_grid(app_config.get('detector', {}), grid)
+    # A few slots keep the Detectors busy; each one holds a full frame in /dev/shm
+    fan_out = SharedFrameRing(len(configs), app_config.get('sweep', {}).get('ring_slots', 3))
+    result_queue = Queue()
+
+    start_time = time.perf_counter()
+    detectors = [
+        Process(target=Detector, args=(fan_out.reader(i), DetectionStatsQueue(result_queue, i), config))
+        for i, (_, config) in enumerate(configs)
+    ]
+    for detector in detectors:
+        detector.start()
+    fan_out.watch(detectors)
+
+    results = [[] for _ in configs]
+    errors = {}
+    finished = set()
+    try:
+        # Decode in this process; the slowest Detector sets the pace
+        streamer_config = dict(app_config.get('streamer', {}), sleep_delay=0)
+        Streamer(fan_out, video_path, streamer_config)
+
+        # Collect results until every Detector has finished or died
+        while len(finished) + len(errors) < len(configs):
+            try:
+                config_index, result = result_queue.get(timeout=RESULT_TIMEOUT)
+            except queue.Empty:
+                for i, detector in enumerate(detectors):
+                    if i not in finished and i not in errors and not detector.is_alive():
+                        errors[i] = f"Detector exited with code {detector.exitcode}"
+                        logger.error(f"Sweep config {configs[i][0]} failed: {errors[i]}")
+                continue
+            if result is None:
+                finished.add(config_index)
+            else:
+                results[config_index].append(result)
+
+        for detector in detectors:
+            detector.join()
+        for i in errors:
+            # Slots still buffered for a dead Detector must not block our exit
+            fan_out.queues[i].cancel_join_thread()
+        if fan_out.error is not None:
+            raise fan_out.error
+    finally:
+        fan_out.close()
+    elapsed = time.perf_counter() - start_time
+
+    frame_count = max((len(results[i]) for i in finished), default=0)
+    logger.info(f"Sweep of {len(configs)} configs over {frame_count} frames took {elapsed:.2f}s")
+
+    summaries = []
+    for i, ((parameters, _), config_results) in enumerate(zip(configs, results)):
+        summary = summarize(parameters, config_results)
+        if i in errors:
+            # Partial results up to the failure
+            summary['error'] = errors[i]
+        summaries.append(summary)
+
+    return {
+        'video': os.path.basename(video_path),
+        'grid': grid,
+        'frames': frame_count,
+        'seconds': elapsed,
+        'configs': summaries
+    }
+
+def run_sweep_job(video_path, app_config, grid, report_path):
+    """Run a sweep and write its report, or the error that stopped it"""
+    try:
+        report = run_sweep(video_path, app_config, grid)
+    except Exception as e:
+        logger.error(f"Error in sweep of {video_path}: {str(e)}")
+        report = {'video': os.path.basename(video_path), 'grid': grid, 'error': str(e)}
+
+    tmp_path = report_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_path, report_path)
+
+def is_job_id(text):
+    """Check that text is a sweep job id, which is safe to build file names from"""
+    try:
+        return str(uuid.UUID(text)) == text
+    except ValueError:
+        return False
+
+def reap_sweep_jobs(app_config):
+    """Record the exit codes of finished sweep jobs and drop their processes"""
+    reaped = False
+    for job_id, process in list(sweep_jobs.items()):
+        returncode = process.poll()
+        if returncode is not None:
+            finished_sweep_jobs[job_id] = returncode
+            del sweep_jobs[job_id]
+            reaped = True
+    if reaped:
+        prune_sweep_outputs(app_config)
+
+def prune_sweep_outputs(app_config):
+    """
+    Delete the files of finished sweeps beyond the newest sweep.max_reports or
+    older than sweep.retention_hours, including those of earlier server runs
+    """
+    sweep_config = app_config.get('sweep', {})
+    output_dir = sweep_config.get('output_dir', 'sweeps')
+    try:
+        names = os.listdir(output_dir)
+    except FileNotFoundError:
+        names = []
+
+    # Finished job id -> when its files were last written
+    written_at = {}
+    for name in names:
+        job_id = name.split('.', 1)[0]
+        if not is_job_id(job_id) or job_id in sweep_jobs:
+            continue
+        try:
+            mtime = os.path.getmtime(os.path.join(output_dir, name))
+        except FileNotFoundError:
+            continue
+        written_at[job_id] = max(written_at.get(job_id, 0), mtime)
+
+    newest_first = sorted(written_at, key=written_at.get, reverse=True)
+    cutoff = time.time() - sweep_config.get('retention_hours', 24) * 3600
+    kept = set(newest_first[:sweep_config.get('max_reports', 50)])
+    for job_id in newest_first:
+        if job_id in kept and written_at[job_id] >= cutoff:
+            continue
+        kept.discard(job_id)
+        for suffix in ('.json', '.json.tmp', '.config.json'):
+            try:
+                os.remove(os.path.join(output_dir, job_id + suffix))
+            except FileNotFoundError:
+                pass
+        logger.info(f"Removed the files of sweep job {job_id}")
+
+    # Forget jobs whose files are gone
+    for job_id in list(finished_sweep_jobs):
+        if job_id not in kept:
+            del finished_sweep_jobs[job_id]
+
+def sweep_job_status(app_config, job_id):
+    """
+    Return the status of a sweep job
+
+    Jobs of earlier server runs are finished if their report is still on disk.
+
+    Returns:
+        'running', 'finished', or None for unknown jobs
+    """
+    if not is_job_id(job_id):
+        return None
+    with jobs_lock:
+        reap_sweep_jobs(app_config)
+        if job_id in sweep_jobs:
+            return 'running'
+        if job_id in finished_sweep_jobs or os.path.exists(sweep_report_path(app_config, job_id)):
+            return 'finished'
+        return None
+
+def start_sweep_job(video_path, app_config, grid):
+    """
+    Start a sweep in a background process
+
+    Returns:
+        The job id, used to fetch the report with sweep_report_path, or None
+        if sweep.max_jobs sweeps are already running
+
+    Raises:
+        ValueError: If the grid is invalid
+    """
+    sweep_config = app_config.get('sweep', {})
+    validate_grid(grid, sweep_config.get('max_configs', 16))
+
+    with jobs_lock:
+        reap_sweep_jobs(app_config)
+        if len(sweep_jobs) >= sweep_config.get('max_jobs', 2):
+            return None
+        prune_sweep_outputs(app_config)
+
+        job_id = str(uuid.uuid4())
+        output_dir = sweep_config.get('output_dir', 'sweeps')
+        os.makedirs(output_dir, exist_ok=True)
+
+        # Keep the settings the sweep ran with next to its report
+        report_path = sweep_report_path(app_config, job_id)
+        config_path = os.path.join(output_dir, f"{job_id}.config.json")
+        with open(config_path, 'w') as f:
+            json.dump({section: app_config.get(section, {}) for section in SWEEP_CONFIG_SECTIONS},
+                      f, indent=2)
+
+        # Run the sweep through the command line in a fresh interpreter: a forked
+        # child of the eventlet server would inherit its greenlets and sockets
+        sweep_jobs[job_id] = subprocess.Popen([
+            sys.executable, os.path.abspath(__file__), video_path,
+            '--grid', json.dumps(grid),
+            '--config', config_path,
+            '--output', report_path
+        ])
+    logger.info(f"Started sweep job {job_id} over {video_path}")
+    return job_id
+
+def sweep_report_path(app_config, job_id):
+    """Return the path of a sweep job's report"""
+    output_dir = app_config.get('sweep', {}).get('output_dir', 'sweeps')
+    return os.path.join(output_dir, f"{job_id}.json")
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate a grid of detector configs in one pass')
+    parser.add_argument('video', help='Video to sweep')
+    parser.add_argument('--grid', required=True,
+                        help='JSON object of parameter -> list of values, e.g. \'{"min_contour_area": [5, 20]}\'')
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        app_config = json.load(f)
+
+    try:
+        grid = json.loads(args.grid)
+        validate_grid(grid)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.output:
+        run_sweep_job(args.video, app_config, grid, args.output)
+    else:
+        json.dump(run_sweep(args.video, app_config, grid), sys.stdout, indent=2)
+        print()
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+import os
+import time
+import numpy as np
+from file_manager import enforce_frame_cache_budget
+from frame_cache import FrameCache
+
+
+def make_entry(cache_dir, key, size, last_used):
+    for suffix, length in (('.frames', size - 10), ('.index.npz', 10)):
+        path = cache_dir / (key + suffix)
+        path.write_bytes(b'\0' * length)
+        os.utime(path, (last_used, last_used))
+
+
+def test_evicts_least_recently_used_first(tmp_path):
+    make_entry(tmp_path, 'old', 100, 1000)
+    make_entry(tmp_path, 'new', 100, 3000)
+    make_entry(tmp_path, 'mid', 100, 2000)
+
+    assert enforce_frame_cache_budget(str(tmp_path), 200) == 100
+    assert sorted(os.listdir(tmp_path)) == ['mid.frames', 'mid.index.npz', 'new.frames', 'new.index.npz']
+
+    # Room for an entry about to be written
+    assert enforce_frame_cache_budget(str(tmp_path), 200, reserve_bytes=50) == 100
+    assert sorted(os.listdir(tmp_path)) == ['new.frames', 'new.index.npz']
+
+
+def test_within_budget_evicts_nothing(tmp_path):
+    make_entry(tmp_path, 'a', 100, 1000)
+    assert enforce_frame_cache_budget(str(tmp_path), 100) == 0
+    assert enforce_frame_cache_budget(str(tmp_path / 'missing'), 0) == 0
+
+
+def test_in_progress_writes_count_but_are_kept(tmp_path):
+    make_entry(tmp_path, 'a', 100, 1000)
+    (tmp_path / 'b.frames.1234.tmp').write_bytes(b'\0' * 100)
+
+    enforce_frame_cache_budget(str(tmp_path), 150)
+    assert os.listdir(tmp_path) == ['b.frames.1234.tmp']
+
+
+def test_orphaned_writes_are_reclaimed_before_evicting(tmp_path):
+    make_entry(tmp_path, 'a', 100, time.time())
+    orphan = tmp_path / 'b.frames.1234.tmp'
+    orphan.write_bytes(b'\0' * 900)
+    os.utime(orphan, (1000, 1000))
+
+    # The orphan's writer stopped writing long ago; it goes, the entry stays
+    assert enforce_frame_cache_budget(str(tmp_path), 1000, reserve_bytes=360) == 900
+    assert sorted(os.listdir(tmp_path)) == ['a.frames', 'a.index.npz']
+
+
+def test_concurrent_writers_of_one_entry(tmp_path):
+    cache = FrameCache(str(tmp_path), 10 ** 6)
+    frames = [np.full((4, 6, 3), i, dtype=np.uint8) for i in range(5)]
+    first = cache.writer('key', frames[0].shape, len(frames))
+    second = cache.writer('key', frames[0].shape, len(frames))
+    assert first.tmp_path != second.tmp_path
+
+    # Interleaved writes must not mix into one file
+    for frame in frames:
+        first.write(frame)
+        second.write(frame)
+    cache.commit(first)
+    cache.commit(second)
+    assert not any(name.endswith('.tmp') for name in os.listdir(tmp_path))
+
+    cached = cache.open('key')
+    assert len(cached) == len(frames)
+    for i, frame in enumerate(frames):
+        assert np.array_equal(cached[i], frame)
+
+
+class ListQueue(list):
+    def put(self, item):
+        self.append(item)
+
+
+def test_stream_continues_without_the_cache_when_writing_it_fails(tmp_path, monkeypatch):
+    from benchmark_engines import make_synthetic_clip
+    from frame_cache import FrameCacheWriter
+    from streamer import END_OF_VIDEO, Streamer
+
+    video_path = str(tmp_path / 'clip.mp4')
+    make_synthetic_clip(video_path, 160, 120, 10)
+    write = FrameCacheWriter.write
+    def write_until_the_disk_is_full(self, frame):
+        if len(self.offsets) == 3:
+            raise OSError(28, 'No space left on device')
+        write(self, frame)
+    monkeypatch.setattr(FrameCacheWriter, 'write', write_until_the_disk_is_full)
+
+    cache_dir = tmp_path / 'cache'
+    output = ListQueue()
+    Streamer(output, video_path, {'sleep_delay': 0, 'frame_cache': {
+        'enabled': True, 'directory': str(cache_dir), 'max_size_mb': 16}})
+
+    assert len(output) == 12 and output[-2:] == [END_OF_VIDEO, None]
+    assert os.listdir(cache_dir) == []
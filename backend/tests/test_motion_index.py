@@ -0,0 +1,82 @@
+import queue
+import numpy as np
+from motion_index import INDEX_DTYPE, motion_segments, save_motion_index
+from streamer import END_OF_VIDEO
+
+
+def make_index(boxes, area=0.1):
+    index = np.zeros(len(boxes), dtype=INDEX_DTYPE)
+    index['boxes'] = boxes
+    index['area'] = [area if b else 0.0 for b in boxes]
+    return index
+
+
+def test_no_motion_gives_no_segments():
+    assert motion_segments(make_index([0] * 10), padding=3) == []
+
+
+def test_runs_without_padding():
+    index = make_index([0, 1, 1, 0, 0, 0, 1, 0])
+    assert motion_segments(index) == [(1, 3), (6, 7)]
+
+
+def test_padding_is_clipped_to_the_video():
+    index = make_index([1, 0, 0, 0, 0, 0, 0, 0, 0, 1])
+    assert motion_segments(index, padding=2) == [(0, 3), (7, 10)]
+
+
+def test_padded_runs_that_touch_are_merged():
+    index = make_index([0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 1, 0])
+    assert motion_segments(index, padding=2) == [(0, 9), (12, 16)]
+
+
+def test_min_area_filters_small_motion():
+    index = make_index([0, 1, 1, 0, 1, 0])
+    index['area'][4] = 0.5
+    assert motion_segments(index, min_area=0.2) == [(4, 5)]
+
+
+def test_save_round_trip(tmp_path):
+    path = str(tmp_path / 'clip.motion.npy')
+    save_motion_index(path, [0, 2], [0.0, 0.25])
+    index = np.load(path)
+    assert index['boxes'].tolist() == [0, 2]
+    assert index['area'].tolist() == [0.0, 0.25]
+
+
+def test_detector_drops_index_after_background_reset(tmp_path):
+    from detector import Detector
+
+    config = {'min_contour_area': 5, 'frames_to_stabilize': 2, 'morph_kernel_size': 3}
+    frames = queue.Queue()
+    for _ in range(5):
+        frames.put((np.zeros((32, 32, 3), dtype=np.uint8), {}))
+    frames.put(END_OF_VIDEO)
+    frames.put(None)
+    control = queue.Queue()
+    control.put({'detection_downscale': 0.5})
+
+    path = tmp_path / 'clip.motion.npy'
+    Detector(frames, None, config, control, str(path))
+    assert not path.exists()
+
+    frames.put((np.zeros((32, 32, 3), dtype=np.uint8), {}))
+    frames.put(END_OF_VIDEO)
+    frames.put(None)
+    Detector(frames, None, config, None, str(path))
+    assert np.load(path)['boxes'].tolist() == [0]
+
+
+def test_detector_saves_no_index_of_a_stream_that_ended_early(tmp_path):
+    from detector import Detector
+
+    config = {'min_contour_area': 5, 'frames_to_stabilize': 2, 'morph_kernel_size': 3}
+    frames = queue.Queue()
+    for _ in range(3):
+        frames.put((np.zeros((32, 32, 3), dtype=np.uint8), {}))
+    # Stopped or failed: the termination signal comes without END_OF_VIDEO
+    frames.put(None)
+
+    path = tmp_path / 'clip.motion.npy'
+    Detector(frames, None, config, None, str(path))
+    assert not path.exists()
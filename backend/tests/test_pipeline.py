@@ -0,0 +1,61 @@
+import os
+import sys
+import subprocess
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Runs the threading engine the way app.py does: monkey patched, with a
+# greenlet logging while the native stage threads log and sleep too
+MONKEY_PATCHED_RUN = '''
+import eventlet
+eventlet.monkey_patch()
+import os, sys, json, queue, logging, faulthandler
+# Show where it hangs, if it does, before the test's timeout kills it
+faulthandler.dump_traceback_later(45, exit=True)
+logging.basicConfig(level=logging.DEBUG, stream=open(os.devnull, 'w'))
+from benchmark_engines import make_synthetic_clip
+from pipeline import Pipeline, use_native_logging_locks
+import detector
+use_native_logging_locks()
+
+emit = detector.Detector._emit
+def logging_emit(self, *args):
+    logging.getLogger('detector').debug('frame')
+    return emit(self, *args)
+detector.Detector._emit = logging_emit
+
+def chatter():
+    while True:
+        logging.getLogger('chatter').debug('greenlet')
+        eventlet.sleep(0)
+
+video_path = sys.argv[1]
+make_synthetic_clip(video_path, 160, 120, 200)
+with open('config.json') as f:
+    config = json.load(f)
+pipeline = Pipeline('threading', config['processing']['queue_sizes'])
+pipeline.start(video_path, dict(config['streamer'], sleep_delay=0.001),
+               config['detector'], config['display'])
+eventlet.spawn(chatter)
+
+frames = 0
+while True:
+    finished = not pipeline.is_alive()
+    try:
+        pipeline.stream_queue.get_nowait()
+        frames += 1
+    except queue.Empty:
+        if finished:
+            break
+        eventlet.sleep(0.001)
+print(frames)
+'''
+
+
+def test_threading_engine_under_monkey_patch(tmp_path):
+    result = subprocess.run(
+        [sys.executable, '-c', MONKEY_PATCHED_RUN, str(tmp_path / 'clip.mp4')],
+        cwd=BACKEND_DIR, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split()[-1] == '200'
@@ -0,0 +1,66 @@
+import os
+import time
+import queue
+import pstats
+import multiprocessing
+from profiler import StageProfiler
+
+
+def request(tmp_path, mode, seconds, name='out'):
+    return {'mode': mode, 'seconds': seconds, 'interval': 0.001, 'path': str(tmp_path / name)}
+
+
+def wait_for(path, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return os.path.exists(path)
+
+
+def test_run_ends_at_deadline_while_the_stage_is_blocked(tmp_path):
+    for mode in ('cprofile', 'sampling'):
+        requests = queue.Queue()
+        requests.put(request(tmp_path, mode, 0.1, mode))
+        profiler = StageProfiler('detector', requests)
+        profiler.poll()
+
+        # No further poll(), as when the stage waits on a full queue
+        assert wait_for(str(tmp_path / mode))
+        profiler.poll()
+        assert profiler.request is None
+
+    pstats.Stats(str(tmp_path / 'cprofile'))
+
+
+def test_stop_writes_the_running_and_pending_requests(tmp_path):
+    requests = queue.Queue()
+    requests.put(request(tmp_path, 'sampling', 60, 'running'))
+    requests.put(request(tmp_path, 'cprofile', 60, 'pending'))
+    profiler = StageProfiler('streamer', requests)
+    profiler.poll()
+
+    profiler.stop()
+    assert os.path.exists(tmp_path / 'running')
+    assert os.path.exists(tmp_path / 'pending')
+    assert requests.empty()
+
+
+def run_blocked_stage(request_queue, started):
+    profiler = StageProfiler('display', request_queue)
+    while profiler.request is None:
+        profiler.poll()
+    started.set()
+    time.sleep(60)
+
+
+def test_terminated_stage_writes_its_profile(tmp_path):
+    requests = multiprocessing.Queue()
+    requests.put(request(tmp_path, 'cprofile', 60))
+    started = multiprocessing.Event()
+    process = multiprocessing.Process(target=run_blocked_stage, args=(requests, started))
+    process.start()
+    assert started.wait(timeout=5)
+
+    process.terminate()
+    process.join(timeout=5)
+    assert os.path.exists(tmp_path / 'out')
@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import uuid
+import pytest
+import numpy as np
+import sweep
+from sweep import expand_grid, summarize, validate_grid
+
+
+@pytest.mark.parametrize('grid, message', [
+    (None, 'non-empty object'),
+    ({}, 'non-empty object'),
+    ({'blur_kernel_size': [5]}, 'Unknown sweep parameters'),
+    ({'min_contour_area': []}, 'non-empty list'),
+    ({'min_contour_area': 5}, 'non-empty list'),
+    ({'min_contour_area': ['5']}, 'must be numbers'),
+    ({'min_contour_area': [True]}, 'must be numbers'),
+    ({'min_contour_area': [float('inf')]}, 'must be numbers'),
+    ({'morph_kernel_size': [-1]}, 'must be positive'),
+    ({'morph_kernel_size': [3.5]}, 'must be integers'),
+    ({'detection_stride': [0]}, 'must be positive'),
+    ({'detection_downscale': [0]}, r'must be in \(0, 1.0\]'),
+    ({'detection_downscale': [1.5]}, r'must be in \(0, 1.0\]'),
+])
+def test_rejects_bad_grids(grid, message):
+    with pytest.raises(ValueError, match=message):
+        validate_grid(grid)
+
+
+def test_rejects_grids_over_the_config_limit():
+    grid = {'min_contour_area': [5, 10, 20], 'morph_kernel_size': [3, 5]}
+    validate_grid(grid, max_configs=6)
+    with pytest.raises(ValueError, match='expands to 6 configs, the limit is 4'):
+        validate_grid(grid, max_configs=4)
+
+
+def test_expand_grid_overrides_the_base_config():
+    configs = expand_grid({'min_contour_area': 1, 'morph_kernel_size': 3},
+                          {'min_contour_area': [5, 10], 'detection_downscale': [0.5]})
+    assert [parameters for parameters, _ in configs] == [
+        {'min_contour_area': 5, 'detection_downscale': 0.5},
+        {'min_contour_area': 10, 'detection_downscale': 0.5}
+    ]
+    assert configs[1][1] == {'min_contour_area': 10, 'morph_kernel_size': 3, 'detection_downscale': 0.5}
+
+
+class FakeProcess:
+    def __init__(self, args):
+        self.args = args
+        self.returncode = None
+
+    def poll(self):
+        return self.returncode
+
+
+def test_caps_running_jobs_and_reaps_finished_ones(tmp_path, monkeypatch):
+    monkeypatch.setattr(sweep.subprocess, 'Popen', FakeProcess)
+    monkeypatch.setattr(sweep, 'sweep_jobs', {})
+    monkeypatch.setattr(sweep, 'finished_sweep_jobs', {})
+    app_config = {
+        'detector': {'min_contour_area': 5},
+        'streamer': {},
+        'processing': {},
+        'profiling': {'admin_token': 'secret'},
+        'sweep': {'output_dir': str(tmp_path), 'max_jobs': 2}
+    }
+    grid = {'min_contour_area': [5, 20]}
+
+    first = sweep.start_sweep_job('video.mp4', app_config, grid)
+    second = sweep.start_sweep_job('video.mp4', app_config, grid)
+    assert sweep.start_sweep_job('video.mp4', app_config, grid) is None
+
+    # Only the sections the sweep needs are written next to its report
+    config_text = (tmp_path / f"{first}.config.json").read_text()
+    assert 'secret' not in config_text
+    assert sorted(json.loads(config_text)) == ['detector', 'processing', 'streamer', 'sweep']
+
+    sweep.sweep_jobs[first].returncode = 0
+    assert sweep.sweep_job_status(app_config, first) == 'finished'
+    assert first not in sweep.sweep_jobs
+    assert sweep.sweep_job_status(app_config, second) == 'running'
+    assert sweep.sweep_job_status(app_config, 'unknown') is None
+    assert sweep.start_sweep_job('video.mp4', app_config, grid) is not None
+
+
+def test_prunes_old_sweeps_and_finds_reports_of_earlier_runs(tmp_path, monkeypatch):
+    monkeypatch.setattr(sweep, 'sweep_jobs', {})
+    monkeypatch.setattr(sweep, 'finished_sweep_jobs', {})
+    app_config = {'sweep': {'output_dir': str(tmp_path), 'max_reports': 2, 'retention_hours': 1}}
+
+    # Reports left by an earlier server run, oldest first
+    now = time.time()
+    job_ids = [str(uuid.uuid4()) for _ in range(4)]
+    for age, job_id in zip([7200, 300, 200, 100], job_ids):
+        for name in [f"{job_id}.json", f"{job_id}.config.json"]:
+            (tmp_path / name).write_text('{}')
+            os.utime(tmp_path / name, (now - age, now - age))
+    (tmp_path / 'notes.json').write_text('{}')
+
+    # A report on disk is found even though this run never started its job
+    assert sweep.sweep_job_status(app_config, job_ids[0]) == 'finished'
+    assert sweep.sweep_job_status(app_config, '../notes') is None
+
+    sweep.prune_sweep_outputs(app_config)
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        ['notes.json'] + [f"{job_id}{suffix}" for job_id in job_ids[2:]
+                          for suffix in ['.json', '.config.json']])
+    assert sweep.sweep_job_status(app_config, job_ids[0]) is None
+    assert sweep.sweep_job_status(app_config, job_ids[3]) == 'finished'
+
+
+class LiveProcess:
+    def is_alive(self):
+        return True
+
+
+def test_shared_frame_ring_reuses_slots_once_every_reader_has_read_them():
+    ring = sweep.SharedFrameRing(2, slots=2)
+    readers = [ring.reader(0), ring.reader(1)]
+    ring.watch([LiveProcess(), LiveProcess()])
+    frames = [np.full((4, 6, 3), i, dtype=np.uint8) for i in range(3)]
+    try:
+        ring.put((frames[0], {'captured_at': 0}))
+        ring.put((frames[1], {'captured_at': 1}))
+        first = [reader.get() for reader in readers]
+        second = [reader.get() for reader in readers]
+
+        # The third frame goes into the first slot, which both readers are done with
+        ring.put((frames[2], {'captured_at': 2}))
+        third = [reader.get() for reader in readers]
+        ring.put(None)
+        assert [reader.get() for reader in readers] == [None, None]
+    finally:
+        ring.close()
+
+    for i, received in enumerate([first, second, third]):
+        for frame, timings in received:
+            assert np.array_equal(frame, frames[i])
+            assert timings == {'captured_at': i}
+    # Frames handed out are copies, untouched by the slot being written again
+    assert np.array_equal(first[0][0], frames[0])
+
+
+def test_shared_frame_ring_refuses_a_ring_larger_than_the_free_shared_memory(monkeypatch):
+    monkeypatch.setattr(sweep, 'shared_memory_free', lambda: 1000)
+    ring = sweep.SharedFrameRing(1, slots=3)
+    try:
+        with pytest.raises(ValueError, match='sweep.ring_slots'):
+            ring.put((np.zeros((10, 20, 3), dtype=np.uint8), {'captured_at': 0}))
+        assert ring.memory is None
+        assert isinstance(ring.error, ValueError)
+    finally:
+        ring.close()
+
+
+def test_summarize():
+    frame_area = 100 * 100
+    results = [
+        ([], 0.001, frame_area),
+        ([(0, 0, 10, 10), (50, 50, 20, 10)], 0.003, frame_area),
+        ([(0, 0, 30, 10)], 0.002, frame_area)
+    ]
+    summary = summarize({'min_contour_area': 5}, results)
+    assert summary['frames'] == 3
+    assert summary['frames_with_motion'] == 2
+    assert summary['total_boxes'] == 3
+    assert summary['max_boxes'] == 2
+    assert summary['box_area_median_px'] == 200
+    assert summary['box_area_max_px'] == 300
+    assert summary['covered_area_mean'] == pytest.approx((0 + 0.03 + 0.03) / 3)
+    assert summary['detector_ms_mean'] == pytest.approx(2.0)
+
+    empty = summarize({}, [])
+    assert empty['frames'] == 0 and empty['boxes_per_frame'] == 0.0
+
+
+def test_failed_detector_is_reported_instead_of_hanging(tmp_path, monkeypatch):
+    from benchmark_engines import make_synthetic_clip
+    import detector
+
+    video_path = str(tmp_path / 'clip.mp4')
+    make_synthetic_clip(video_path, 160, 120, 120)
+
+    # Forked Detector processes inherit the patched method
+    detect_motion = detector.Detector.detect_motion
+    def failing_detect_motion(self):
+        if self.config['min_contour_area'] == 13:
+            raise RuntimeError('boom')
+        detect_motion(self)
+    monkeypatch.setattr(detector.Detector, 'detect_motion', failing_detect_motion)
+    monkeypatch.setattr(sweep, 'RESULT_TIMEOUT', 0.2)
+
+    app_config = {
+        'detector': {'min_contour_area': 5, 'frames_to_stabilize': 5, 'morph_kernel_size': 3},
+        'processing': {'queue_sizes': {'frames_queue': 4}}
+    }
+    report = sweep.run_sweep(video_path, app_config, {'min_contour_area': [5, 13]})
+
+    ok, failed = report['configs']
+    assert 'error' not in ok and ok['frames'] == 120
+    assert failed['error'].startswith('Detector exited with code')
+    assert report['frames'] == 120
@@ -0,0 +1,156 @@
+from tuner import AutoTuner
+
+PACING = 0.05
+FULL = {'frames_queue': (30, 30), 'detection_queue': (30, 30), 'stream_queue': (10, 10)}
+DETECTOR_BOUND = {'frames_queue': (30, 30), 'detection_queue': (0, 30), 'stream_queue': (0, 10)}
+
+
+SLEEP_DELAY = {'stage': 'streamer', 'min': 0.01, 'max': 0.2, 'step': 0.02}
+
+
+def make_tuner(pacing=PACING, **overrides):
+    config = {
+        'target_latency_ms': 100,
+        'tolerance': 0.2,
+        'interval_frames': 10,
+        'congestion_threshold': 0.8,
+        'order': ['encoding_quality', 'detection_downscale'],
+        'knobs': {
+            'encoding_quality': {'stage': 'encoder', 'min': 40, 'max': 90, 'step': -10},
+            'detection_downscale': {'stage': 'detector', 'min': 0.25, 'max': 1.0, 'step': -0.25}
+        }
+    }
+    config.update(overrides)
+    return AutoTuner(config, {'encoding_quality': 90, 'detection_downscale': 1.0, 'sleep_delay': 0.01},
+                     pacing_interval=pacing)
+
+
+def feed(tuner, frames, detector_cost, queue_depths, latency, start=1000.0, encoder_cost=0.002):
+    """Deliver frames at the rate the slowest of the pacing and the stages allows"""
+    now = start
+    for _ in range(frames):
+        now += max(tuner.pacing_interval + encoder_cost, detector_cost)
+        timings = {'captured_at': now - latency, 'streamer': 0.001,
+                   'detector': detector_cost, 'display': 0.002, 'encoder': encoder_cost}
+        tuner.observe(timings, queue_depths, now=now)
+    return now
+
+
+def test_initial_values_are_clamped():
+    tuner = AutoTuner({'knobs': {'detection_stride': {'stage': 'detector', 'min': 1, 'max': 4, 'step': 1}}},
+                      {'detection_stride': 9})
+    assert tuner.value('detection_stride') == 4
+
+
+def test_degrades_slowest_stage_one_step_per_interval_and_clamps():
+    tuner = make_tuner()
+    feed(tuner, 10, 0.2, DETECTOR_BOUND, latency=2.0)
+    assert tuner.adjustments == [('detection_downscale', 1.0, 0.75)]
+
+    feed(tuner, 100, 0.2, DETECTOR_BOUND, latency=2.0)
+    assert tuner.value('detection_downscale') == 0.25
+    # Other stages' knobs are left alone; they are not what holds frames up
+    assert tuner.value('encoding_quality') == 90
+
+    # Nothing moves past its bounds
+    adjustments = len(tuner.adjustments)
+    feed(tuner, 50, 0.2, DETECTOR_BOUND, latency=2.0)
+    assert len(tuner.adjustments) == adjustments
+
+
+def test_holds_when_pacing_fills_the_queues_without_a_backlog_knob():
+    tuner = make_tuner()
+    # Every queue full and seconds of queue wait, but the stages are cheap
+    feed(tuner, 500, 0.005, FULL, latency=3.0)
+    assert tuner.adjustments == []
+    assert tuner.value('encoding_quality') == 90
+    assert tuner.value('detection_downscale') == 1.0
+
+
+def test_degrades_the_encoder_when_it_is_slower_than_the_pacing():
+    tuner = make_tuner(pacing=0.002)
+    feed(tuner, 600, 0.005, FULL, latency=0.8, encoder_cost=0.08)
+    assert tuner.value('encoding_quality') == 40
+    assert tuner.value('detection_downscale') == 1.0
+
+
+def test_shrinks_the_backlog_behind_the_pacing_until_latency_settles():
+    order = ['encoding_quality', 'detection_downscale', 'sleep_delay']
+    tuner = make_tuner(target_latency_ms=60, order=order,
+                       knobs=dict(make_tuner().knobs, sleep_delay=SLEEP_DELAY))
+    period = PACING + 0.002
+    backlog = 70.0
+    now = 1000.0
+
+    def run(frames):
+        nonlocal backlog, now
+        latencies = []
+        for _ in range(frames):
+            now += period
+            # Frames captured while one is delivered pile up in the queues
+            capture_period = tuner.value('sleep_delay') + 0.001
+            backlog = min(max(backlog + period / capture_period - 1, 0.0), 70.0)
+            depths = FULL if backlog >= 8 else {'frames_queue': (0, 30), 'detection_queue': (0, 30),
+                                                'stream_queue': (int(backlog), 10)}
+            latency = backlog * period + 0.01
+            latencies.append(latency)
+            tuner.observe({'captured_at': now - latency, 'streamer': 0.001, 'detector': 0.005,
+                           'display': 0.002, 'encoder': 0.002}, depths, now=now)
+        return latencies
+
+    run(1500)
+    # Capture is slowed until the queues drain, without touching the stages' knobs
+    assert {name for name, _, _ in tuner.adjustments} == {'sleep_delay'}
+    assert tuner.value('sleep_delay') > period
+    settled = len(tuner.adjustments)
+    assert max(run(1500)) < 0.06
+    assert len(tuner.adjustments) == settled
+
+
+def test_without_a_backlog_degrades_the_stage_latency_is_spent_in():
+    tuner = make_tuner()
+    feed(tuner, 10, 0.005, {'stream_queue': (0, 10)}, latency=0.15, encoder_cost=0.1)
+    assert tuner.adjustments == [('encoding_quality', 90, 80)]
+
+    # Latency the stages don't account for is spent moving frames; no knob helps
+    tuner = make_tuner()
+    feed(tuner, 100, 0.005, {'stream_queue': (0, 10)}, latency=0.3, encoder_cost=0.02)
+    assert tuner.adjustments == []
+
+
+def test_fps_target_holds_when_pacing_is_the_limit():
+    tuner = make_tuner(target_fps=30, knobs=dict(make_tuner().knobs, sleep_delay=SLEEP_DELAY))
+    feed(tuner, 300, 0.005, FULL, latency=0.5)
+    assert tuner.adjustments == []
+
+
+def test_restores_with_headroom():
+    tuner = make_tuner()
+    tuner.values['encoding_quality'] = 60
+    feed(tuner, 10, 0.005, {'stream_queue': (0, 10)}, latency=0.02)
+    assert tuner.adjustments == [('encoding_quality', 60, 70)]
+
+
+def test_uses_stage_cost_without_queue_depths():
+    tuner = make_tuner()
+    feed(tuner, 10, 0.2, {'stream_queue': (None, 10)}, latency=2.0)
+    assert tuner.adjustments == [('detection_downscale', 1.0, 0.75)]
+
+
+def test_settles_instead_of_pinning_knobs():
+    tuner = make_tuner(target_fps=1 / PACING)
+    now = 1000.0
+    # The detector's cost scales with the frame area it works on
+    for _ in range(100):
+        cost = 0.12 * tuner.value('detection_downscale') ** 2
+        depths = DETECTOR_BOUND if cost > PACING else FULL
+        now = feed(tuner, 10, cost, depths, latency=0.5, start=now)
+
+    # Lowered until the detector keeps up with the pacing, and no further
+    assert tuner.value('detection_downscale') == 0.5
+    assert tuner.value('encoding_quality') == 90
+    settled = len(tuner.adjustments)
+    for _ in range(50):
+        cost = 0.12 * tuner.value('detection_downscale') ** 2
+        now = feed(tuner, 10, cost, DETECTOR_BOUND if cost > PACING else FULL, latency=0.5, start=now)
+    assert len(tuner.adjustments) == settled
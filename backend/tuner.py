@@ -0,0 +1,294 @@
+import time
+import logging
+from collections import Counter, deque
+
+logger = logging.getLogger(__name__)
+
+# The AutoTuner class is a closed-loop controller that runs alongside the
+# streaming loop. It is fed the timings that travel with every frame: the
+# wall-clock time the Streamer captured it and the seconds each stage
+# (streamer, detector, display, encoder) spent on it, together with the depth
+# of the inter-stage queues. From these it measures the real end-to-end
+# latency (capture to delivery, queue wait included) and the delivered frame
+# rate, and finds the bottleneck: the stage behind the last backed-up queue,
+# or, when no queue backs up and a frame's latency is the time the stages
+# spend on it, the most expensive stage.
+# Once per control interval it compares the measurements against the
+# configured target and moves one knob by one step: towards the cheap end when
+# the target is missed, back towards the quality end when there is headroom.
+# Only knobs of the bottleneck stage are made cheaper; making another stage
+# cheaper costs quality without delivering frames any sooner. When the
+# bottleneck has no cheaper setting left, or the streaming loop's pacing is
+# the limit, a latency target is met by shrinking the backlog instead: the
+# Streamer's knobs slow down capture so that frames stop waiting in queues.
+# Knobs owned by a child process are pushed to that process through its
+# control queue; knobs owned by the parent (JPEG quality) are read back with
+# value(). Every adjustment is logged.
+
+# Stages in pipeline order, used to attribute cost to a knob's owner. The
+# encoder is the streaming loop, which encodes and emits every frame.
+STAGES = ['streamer', 'detector', 'display', 'encoder']
+
+# Inter-stage queues and the stage that reads each, in pipeline order
+QUEUE_READERS = [('frames_queue', 'detector'), ('detection_queue', 'display'),
+                 ('stream_queue', 'encoder')]
+
+# Bottleneck of a frame delivered at the rate the streaming loop paces it
+PACING = 'pacing'
+
+# Stage whose knobs throttle capture to shrink the backlog
+BACKLOG_STAGE = 'streamer'
+
+
+class AutoTuner:
+    def __init__(self, config, initial_values, control_queues=None, pacing_interval=0.0):
+        """
+        Initialize the tuner
+
+        Args:
+            config: The 'tuner' configuration section
+            initial_values: Dictionary of knob name -> starting value
+            control_queues: Dictionary of stage name -> Queue used to push
+                            config updates into that stage's process
+            pacing_interval: Seconds the streaming loop sleeps per frame, used
+                             to find the bottleneck when queue depths are unknown
+        """
+        self.config = config
+        self.control_queues = control_queues or {}
+        self.knobs = config.get('knobs', {})
+        self.pacing_interval = pacing_interval
+
+        # Either a delivered frame rate or an end-to-end latency is targeted
+        self.target_fps = config.get('target_fps')
+        self.target_latency = config.get('target_latency_ms', 100) / 1000.0
+        self.tolerance = config.get('tolerance', 0.2)
+        self.interval = config.get('interval_frames', 30)
+        self.congestion_threshold = config.get('congestion_threshold', 0.8)
+
+        # Clamp starting values into their configured bounds
+        self.values = {}
+        for name, spec in self.knobs.items():
+            value = initial_values.get(name, spec['max'] if spec['step'] < 0 else spec['min'])
+            self.values[name] = min(max(value, spec['min']), spec['max'])
+
+        window = config.get('window', self.interval)
+        self.latencies = deque(maxlen=window)
+        self.arrivals = deque(maxlen=window)
+        self.stage_costs = {stage: deque(maxlen=window) for stage in STAGES}
+        self.bottlenecks = Counter()
+        self.frames_since_adjustment = 0
+        self.now = None
+        self.adjustments = []
+
+        # Knob values a restore overloaded the pipeline with; never retried
+        self.restore_limits = {}
+        self.last_restored = None
+        self.holding = False
+
+        # Mean latency of the previous control interval
+        self.last_latency = None
+
+        # When the last knob moved, and how many frames since were captured
+        # after that; frames already queued don't show the change
+        self.adjusted_at = None
+        self.fresh_samples = 0
+
+        if self.target_fps:
+            target = f"{self.target_fps} fps"
+        else:
+            target = f"{self.target_latency * 1000:.1f} ms end-to-end latency"
+        logger.info(f"AutoTuner started with target {target} and knobs {self.values}")
+
+    def value(self, name):
+        """Return the current value of a knob"""
+        return self.values[name]
+
+    def observe(self, timings, queue_depths=None, now=None):
+        """
+        Record one delivered frame and adjust knobs when an interval elapses
+
+        Args:
+            timings: Dictionary of stage name -> seconds spent on this frame,
+                     plus 'captured_at', the wall-clock capture time
+            queue_depths: Dictionary of queue name -> (depth, maxsize)
+            now: Wall-clock delivery time, defaults to the current time
+        """
+        now = time.time() if now is None else now
+        self.now = now
+        self.arrivals.append(now)
+        if 'captured_at' in timings:
+            self.latencies.append(now - timings['captured_at'])
+        if self.adjusted_at is None or timings.get('captured_at', now) >= self.adjusted_at:
+            self.fresh_samples += 1
+        for stage in STAGES:
+            if stage in timings:
+                self.stage_costs[stage].append(timings[stage])
+
+        self.bottlenecks[self._bottleneck(timings, queue_depths)] += 1
+
+        self.frames_since_adjustment += 1
+        if self.frames_since_adjustment >= self.interval:
+            self._adjust()
+
+    def _bottleneck(self, timings, queue_depths):
+        """
+        Find what limits delivery of this frame
+
+        A stage that cannot keep up has a full queue in front of it, and the
+        queues further upstream fill up behind that one, so the bottleneck is
+        the reader of the last backed-up queue. The streaming loop's queue is full
+        both when encoding is slower than the pacing and when the pacing
+        alone holds frames back; the encoder's cost tells the two apart.
+
+        Returns:
+            A stage name, PACING, or None when no backlog builds up
+        """
+        depths = {name: (depth, maxsize) for name, (depth, maxsize) in (queue_depths or {}).items()
+                  if depth is not None and maxsize}
+        if not depths:
+            # No queue depths on this platform: compare stage cost with the pacing
+            costs = {stage: timings[stage] for stage in STAGES if stage in timings}
+            if not costs:
+                return None
+            stage = max(costs, key=costs.get)
+            if costs[stage] <= self.pacing_interval:
+                return PACING
+            # A slow decode builds no backlog to shrink
+            return None if stage == BACKLOG_STAGE else stage
+
+        bottleneck = None
+        for name, stage in QUEUE_READERS:
+            if name in depths and depths[name][0] >= self.congestion_threshold * depths[name][1]:
+                bottleneck = stage
+        if bottleneck == 'encoder' and timings.get('encoder', 0.0) <= self.pacing_interval:
+            return PACING
+        return bottleneck
+
+    def _mean(self, samples):
+        return sum(samples) / len(samples) if samples else 0.0
+
+    def _delivered_fps(self):
+        if len(self.arrivals) < 2 or self.arrivals[-1] <= self.arrivals[0]:
+            return 0.0
+        return (len(self.arrivals) - 1) / (self.arrivals[-1] - self.arrivals[0])
+
+    def _adjust(self):
+        """Move a single knob one step based on the current window"""
+        if self.fresh_samples <= self.frames_since_adjustment // 2:
+            # Wait for frames captured since the last change
+            self.frames_since_adjustment = 0
+            self.fresh_samples = 0
+            self.bottlenecks.clear()
+            return
+
+        latency = self._mean(self.latencies)
+        fps = self._delivered_fps()
+
+        # What limited most frames in this window
+        bottleneck, count = self.bottlenecks.most_common(1)[0]
+        if count <= self.frames_since_adjustment // 2:
+            bottleneck = None
+        backlog = bottleneck is not None
+        costs = {stage: self._mean(samples) for stage, samples in self.stage_costs.items()}
+        if not backlog and not self.target_fps and sum(costs.values()) >= latency / 2:
+            # Without a backlog, latency is mostly the time the stages spend on
+            # a frame; otherwise it goes to moving frames between them
+            bottleneck = max((stage for stage in STAGES if stage != BACKLOG_STAGE), key=costs.get)
+        stage_bound = backlog and bottleneck in STAGES
+
+        if self.target_fps:
+            missed = fps < self.target_fps * (1 - self.tolerance)
+            headroom = not missed
+        else:
+            missed = latency > self.target_latency * (1 + self.tolerance)
+            headroom = latency < self.target_latency * (1 - self.tolerance)
+
+        # A backlog that is still draining after the last change needs no other
+        draining = (not self.target_fps and self.last_latency is not None
+                    and latency < self.last_latency)
+        self.last_latency = latency
+
+        name = None
+        holding = False
+        if missed and draining:
+            pass
+        elif missed:
+            if bottleneck in STAGES:
+                name = self._pick_knob_to_degrade(bottleneck)
+                reason = f"{bottleneck} bound" if stage_bound else f"latency spent in {bottleneck}"
+            if name is None and backlog and not self.target_fps:
+                # Frames wait behind the bottleneck; capture fewer of them
+                name = self._pick_knob_to_degrade(BACKLOG_STAGE)
+                reason = f"backlog behind {bottleneck}"
+            direction = 1
+            if name is not None and name == self.last_restored:
+                # The last restore overloaded the pipeline; keep it undone
+                self.restore_limits[name] = self.values[name]
+            if name is None:
+                holding = True
+                if not self.holding:
+                    cause = (f"no knob left to relieve {bottleneck}" if bottleneck
+                             else "no stage or backlog accounts for it")
+                    logger.info(f"AutoTuner: holding, target missed with {cause} "
+                                f"(mean latency {latency * 1000:.1f} ms, {fps:.1f} fps)")
+        elif headroom and not stage_bound:
+            name = self._pick_knob_to_restore()
+            reason = 'headroom'
+            direction = -1
+        self.holding = holding
+
+        self.frames_since_adjustment = 0
+        self.fresh_samples = 0
+        self.bottlenecks.clear()
+        if name is None:
+            return
+
+        spec = self.knobs[name]
+        old_value = self.values[name]
+        new_value = min(max(old_value + direction * spec['step'], spec['min']), spec['max'])
+        if isinstance(new_value, float):
+            new_value = round(new_value, 4)
+        self.values[name] = new_value
+        self.last_restored = name if direction < 0 else None
+        self.adjusted_at = self.now
+
+        # Push the change into the owning stage, if it runs in a child process
+        control_queue = self.control_queues.get(spec['stage'])
+        if control_queue is not None:
+            control_queue.put({name: new_value})
+
+        self.adjustments.append((name, old_value, new_value))
+        logger.info(f"AutoTuner: {name} {old_value} -> {new_value} "
+                    f"({reason}, mean latency {latency * 1000:.1f} ms, {fps:.1f} fps)")
+
+        # Start the next window with measurements taken under the new setting
+        self.latencies.clear()
+        self.arrivals.clear()
+        for costs in self.stage_costs.values():
+            costs.clear()
+
+    def _can_move(self, name, direction):
+        spec = self.knobs[name]
+        value = round(self.values[name] + direction * spec['step'], 4)
+        if direction < 0 and name in self.restore_limits:
+            # Don't restore to a value that overloaded the pipeline before
+            limit = self.restore_limits[name]
+            if (spec['step'] < 0 and value >= limit) or (spec['step'] > 0 and value <= limit):
+                return False
+        return spec['min'] <= value <= spec['max']
+
+    def _pick_knob_to_degrade(self, stage):
+        """Pick the first knob of a stage, in config order, that can still be degraded"""
+        order = self.config.get('order', list(self.knobs))
+        for name in order:
+            if self.knobs[name]['stage'] == stage and self._can_move(name, 1):
+                return name
+        return None
+
+    def _pick_knob_to_restore(self):
+        """Restore knobs in the reverse of the configured degrade order"""
+        order = self.config.get('order', list(self.knobs))
+        for name in reversed(order):
+            if self._can_move(name, -1):
+                return name
+        return None
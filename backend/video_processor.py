@@ -1,11 +1,14 @@
 import os
+import time
+import uuid
+import queue
 import base64
 import threading
 import cv2
-import multiprocessing
-from multiprocessing import Process, Queue
 import logging
 from file_manager import cleanup_video_file
+from motion_index import index_path_for, load_motion_index, motion_segments
+from pipeline import Pipeline, mp_context
 
 logger = logging.getLogger(__name__)
 
@@ -17,9 +20,100 @@ processing_thread = None
 is_paused = False
 current_video_path = None
 
-def process_and_stream_video(video_path, app_config, socketio):
-    """Process video frames using multiprocessing components and stream to client"""
-    global processing_active, streaming_active, is_paused, current_video_path
+# The running pipeline, whose stages can be profiled
+active_pipeline = None
+
+# Serializes claim_processing() across requests
+session_lock = threading.Lock()
+
+def claim_processing():
+    """
+    Mark processing as started unless a session is already running
+    
+    Requests call this right before starting process_and_stream_video, so
+    that two requests cannot both pass the "already in progress" check.
+    
+    Returns:
+        True if the caller may start a session
+    """
+    global processing_active
+    with session_lock:
+        if processing_active or streaming_active:
+            return False
+        processing_active = True
+        return True
+
+def release_processing():
+    """Undo claim_processing when the claimed session could not be started"""
+    global processing_active
+    with session_lock:
+        processing_active = False
+
+def request_profile(stage, mode, seconds, output_dir, interval=0.005):
+    """
+    Ask a running pipeline stage to profile itself
+    
+    Returns:
+        The filename the profile will be written to inside output_dir
+    
+    Raises:
+        ValueError: If no pipeline is running, the stage is unknown or it
+                    has already finished
+    """
+    pipeline = active_pipeline
+    if pipeline is None or stage not in pipeline.profile_queues:
+        raise ValueError(f"Stage '{stage}' is not running")
+    if not pipeline.stage_alive(stage):
+        raise ValueError(f"Stage '{stage}' has already finished")
+    
+    extension = 'prof' if mode == 'cprofile' else 'collapsed'
+    # The random suffix keeps requests made within the same second apart
+    filename = f"{stage}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}-{mode}.{extension}"
+    os.makedirs(output_dir, exist_ok=True)
+    
+    pipeline.profile_queues[stage].put({
+        'mode': mode,
+        'seconds': seconds,
+        'interval': interval,
+        'path': os.path.abspath(os.path.join(output_dir, filename))
+    })
+    logger.info(f"Requested {mode} profile of {stage} for {seconds}s")
+    return filename
+
+def build_motion_index(video_path, app_config):
+    """Run a detection-only pass over a video to write its motion index"""
+    from streamer import Streamer
+    from detector import Detector
+    
+    queue_sizes = app_config.get('processing', {}).get('queue_sizes', {})
+    frames_queue = mp_context.Queue(maxsize=queue_sizes.get('frames_queue', 0))
+    
+    # Nothing downstream consumes the frames, so read as fast as detection allows
+    streamer_config = dict(app_config.get('streamer', {}), sleep_delay=0)
+    
+    processes = [
+        mp_context.Process(target=Streamer, args=(frames_queue, video_path, streamer_config)),
+        mp_context.Process(target=Detector,
+                           args=(frames_queue, None, app_config.get('detector', {}),
+                                 None, index_path_for(video_path)))
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    
+    return load_motion_index(video_path)
+
+def process_and_stream_video(video_path, app_config, socketio, playback_mode=None):
+    """
+    Process video frames through the pipeline and stream them to the client
+    
+    The stages run as processes or threads depending on processing.engine.
+    In 'full' playback mode every frame is streamed and the motion index is
+    (re)written as a side effect. In 'motion_only' mode the motion index is
+    built first if missing, and only the padded motion segments are streamed.
+    """
+    global processing_active, streaming_active, is_paused, current_video_path, active_pipeline
     
     # Store the video path for cleanup later
     current_video_path = video_path
@@ -29,8 +123,8 @@ def process_and_stream_video(video_path, app_config, socketio):
     streaming_active = True
     is_paused = False
     
-    # Keep track of processes
-    processes = []
+    # Keep track of the running pipeline
+    pipeline = None
     
     try:    
         # Get processing configuration
@@ -39,38 +133,82 @@ def process_and_stream_video(video_path, app_config, socketio):
         progress_reporting = processing_config.get('progress_reporting', {})
         sleep_delays = processing_config.get('sleep_delays', {})
         client_config = app_config.get('client', {}).get('ui', {})
+        tuner_config = app_config.get('tuner', {})
+        streamer_config = app_config.get('streamer', {})
+        detector_config = app_config.get('detector', {})
+        display_config = app_config.get('display', {})
+        playback_config = app_config.get('playback', {})
+        playback_mode = playback_mode or playback_config.get('mode', 'full')
         
-        # Create communication queues
-        frames_queue = Queue()
-        detection_queue = Queue()
-        stream_queue = Queue(maxsize=queue_sizes.get('stream_queue', 10))
-        
-        # Create and start processes with respective configs
-        from streamer import Streamer
-        from detector import Detector
-        from display import Display
+        # Decide which frames to stream
+        segments = None
+        index_path = index_path_for(video_path)
+        if playback_mode == 'motion_only':
+            motion_index = load_motion_index(video_path)
+            if motion_index is None:
+                socketio.emit('message', {'data': 'Building motion index...'})
+                motion_index = build_motion_index(video_path, app_config)
+                if not processing_active:
+                    return
+            
+            if motion_index is not None:
+                segments = motion_segments(
+                    motion_index,
+                    padding=playback_config.get('motion_padding_frames', 30),
+                    min_area=playback_config.get('min_motion_area', 0.0)
+                )
+                motion_frames = sum(end - start for start, end in segments)
+                socketio.emit('message', {'data': f"Streaming {len(segments)} motion segments "
+                                                  f"({motion_frames} of {len(motion_index)} frames)"})
+                # A partial pass must not overwrite the full index
+                index_path = None
+            else:
+                logger.warning(f"No motion index for {video_path}, streaming all frames")
         
-        streamer_process = Process(
-            target=Streamer, 
-            args=(frames_queue, video_path, app_config.get('streamer', {}))
-        )
+        # Create the pipeline queues for the configured engine
+        pipeline = Pipeline(processing_config.get('engine', 'multiprocessing'), queue_sizes)
+        stream_queue = pipeline.stream_queue
         
-        detector_process = Process(
-            target=Detector, 
-            args=(frames_queue, detection_queue, app_config.get('detector', {}))
-        )
+        # Set up the auto-tuner if enabled
+        tuner = None
+        if tuner_config.get('enabled', False):
+            from tuner import AutoTuner
+            tuner = AutoTuner(
+                tuner_config,
+                initial_values={
+                    'encoding_quality': client_config.get('encoding_quality', 85),
+                    'blur_kernel_size': display_config.get('blur_kernel_size'),
+                    'detection_downscale': detector_config.get('detection_downscale', 1.0),
+                    'detection_stride': detector_config.get('detection_stride', 1),
+                    'sleep_delay': streamer_config.get('sleep_delay', 0.01)
+                },
+                control_queues=pipeline.control_queues,
+                pacing_interval=sleep_delays.get('frame_processing', 0.05)
+            )
+            
+            # Start the stages from the tuner's clamped values
+            streamer_config = dict(streamer_config)
+            detector_config = dict(detector_config)
+            display_config = dict(display_config)
+            for name, value in tuner.values.items():
+                stage = tuner.knobs[name]['stage']
+                if stage == 'streamer':
+                    streamer_config[name] = value
+                elif stage == 'detector':
+                    detector_config[name] = value
+                elif stage == 'display':
+                    display_config[name] = value
         
-        display_process = Process(
-            target=Display, 
-            args=(detection_queue, stream_queue, app_config.get('display', {}))
+        # Start the stages with their respective configs
+        pipeline.start(
+            video_path,
+            streamer_config,
+            detector_config,
+            display_config,
+            segments,
+            index_path
         )
-        
-        # Store processes in list for cleanup
-        processes = [streamer_process, detector_process, display_process]
-        
-        # Start the processes
-        for process in processes:
-            process.start()
+        active_pipeline = pipeline
         
         # Function to check if processing should be paused/stopped
         def should_continue():
@@ -84,11 +222,16 @@ def process_and_stream_video(video_path, app_config, socketio):
             while streaming_active:
                 if not is_paused:
                     try:
-                        # Non-blocking get with timeout
-                        processed_frame = stream_queue.get(timeout=0.5)
+                        # Non-blocking get so the event loop is never held up,
+                        # whichever engine produced the frame
+                        processed_frame, timings = stream_queue.get_nowait()
                         
                         # Encode frame and send to client
-                        encoding_quality = client_config.get('encoding_quality', 85)
+                        encode_start = time.perf_counter()
+                        if tuner is not None:
+                            encoding_quality = tuner.value('encoding_quality')
+                        else:
+                            encoding_quality = client_config.get('encoding_quality', 85)
                         encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), encoding_quality]
                         _, buffer = cv2.imencode('.jpg', processed_frame, encode_param)
                         jpg_as_text = base64.b64encode(buffer).decode('utf-8')
@@ -97,8 +240,16 @@ def process_and_stream_video(video_path, app_config, socketio):
                         if streaming_active:
                             socketio.emit('frame', {
                                 'frame': jpg_as_text,
-                                'count': frame_count + 1
+                                'count': frame_count + 1,
+                                # Capture time, so clients can measure end-to-end latency
+                                'timestamp': timings.get('captured_at', time.time())
                             })
+                        timings['encoder'] = time.perf_counter() - encode_start
+                        
+                        # Feed the measurements to the tuner, with encoding and
+                        # emitting as this loop's own cost per frame
+                        if tuner is not None:
+                            tuner.observe(timings, pipeline.queue_depths())
                         
                         frame_count += 1
                         
@@ -116,7 +267,7 @@ def process_and_stream_video(video_path, app_config, socketio):
                             if frame_count % log_interval == 0:
                                 logger.info(f"Processed and streamed {frame_count} frames")
                     
-                    except multiprocessing.queues.Empty:
+                    except queue.Empty:
                         # No frame available, just continue
                         socketio.sleep(sleep_delays.get('empty_queue', 0.01))
                         continue
@@ -137,13 +288,22 @@ def process_and_stream_video(video_path, app_config, socketio):
         streaming_thread.daemon = True
         streaming_thread.start()
         
-        # Wait for processes to finish (or be terminated)
-        for process in processes:
-            process.join()
+        # Wait for the stages to finish, winding them down if we are stopped
+        while pipeline.is_alive():
+            if not processing_active:
+                pipeline.stop()
+            socketio.sleep(0.1)
+        
+        # Let the client catch up on frames that are still queued
+        while streaming_active and not stream_queue.empty():
+            socketio.sleep(0.1)
         
         if processing_active:  # If we weren't interrupted
             socketio.emit('processing_complete', {'frames': 0})  # We don't know exact frame count
             socketio.emit('complete', {'data': 'Finished processing and streaming video'})
+        elif not os.path.exists(video_path):
+            # Stopped: remove the index the detector wrote after the video was deleted
+            cleanup_video_file(video_path)
             
     except Exception as e:
         logger.error(f"Error in processing and streaming: {str(e)}")
@@ -151,10 +311,9 @@ def process_and_stream_video(video_path, app_config, socketio):
         processing_active = False
         streaming_active = False
         
-        # Clean up processes that might still be running
-        for process in processes:
-            if process.is_alive():
-                process.terminate()
+        # Clean up stages that might still be running
+        if pipeline is not None:
+            pipeline.terminate()
                 
         cleanup_video_file(video_path)
         return
@@ -163,4 +322,5 @@ def process_and_stream_video(video_path, app_config, socketio):
         # Clean up and reset state
         processing_active = False
         streaming_active = False
+        active_pipeline = None
         logger.info("Processing and streaming complete") 
\ No newline at end of file